@@ -227,7 +227,7 @@ static int armv7_disas_uncond(darm_t *d, uint32_t w)
         return 0;
     }
 
-    fprintf(stderr, "armv7_disas_uncond: unreachable\n");
+    DARM_ERROR(E_UNHANDLED, "armv7_disas_uncond: unreachable\n");
     return -1;
 }
 
@@ -845,7 +845,7 @@ static int armv7_disas_cond(darm_t *d, uint32_t w)
         d->Rm = w & b1111;
         return 0;
     }
-    fprintf(stderr, "armv7_disas_cond: unreachable\n");
+    DARM_ERROR(E_UNHANDLED, "armv7_disas_cond: unreachable\n");
     return -1;
 }
 
@@ -874,34 +874,23 @@ static darm_fieldloader_t* get_fieldloader(darm_t *d, uint32_t w)
     return f;
 }
 
-int darm_armv7_disasm(darm_t *d, uint32_t w)
+static int armv7_disasm(darm_t *d, uint32_t w)
 {
     int ret = -1;
 
     // initialize the entire darm state, in order to make sure that no members
     // contain undefined data
-    memset(d, 0, sizeof(darm_t));
+    darm_init(d);
     d->w = w;
     d->cond = (w >> 28) & b1111;
-    d->instr = I_INVLD;
-    d->instr_type = T_INVLD;
-    d->shift_type = S_INVLD;
-    d->S = d->E = d->U = d->H = d->P = d->I = B_INVLD;
-    d->R = d->T = d->W = d->M = d->N = d->B = B_INVLD;
-    d->dtype = d->stype = D_INVLD;
-    d->Rd = d->Rn = d->Rm = d->Ra = d->Rt = R_INVLD;
-    d->Rt2 = d->RdHi = d->RdLo = d->Rs = R_INVLD;
-    d->option = O_INVLD;
     d->size = 4;
 
-    // rotate, imm, shift, lsb, width, reglist, cpsr, mode -- initialized to 0
-
     // check for autoloading instructions
     darm_fieldloader_t *f = get_fieldloader(d, w);
     if( f != NULL ) {
 
         if(f->instr == I_INVLD) {
-            fprintf(stderr, "armv7.c: get_fieldloader: null lookup for 0x%lx\n", w);
+            DARM_ERROR(E_LOOKUP, "armv7.c: get_fieldloader: null lookup for 0x%lx\n", w);
             return -1;
         }
         return load_fields(d, w, f);
@@ -926,49 +915,69 @@ int darm_armv7_disasm(darm_t *d, uint32_t w)
     return 0;
 }
 
+int darm_armv7_disasm(darm_t *d, uint32_t w)
+{
+#ifdef DARM_STATS
+    uint64_t start = darm_stats_clock();
+    int ret = armv7_disasm(d, w);
+    darm_stats_record(d, ret, darm_stats_clock() - start);
+    return ret;
+#else
+    return armv7_disasm(d, w);
+#endif
+}
+
 const char *darm_mnemonic_name(darm_instr_t instr)
 {
     return instr < ARRAYSIZE(darm_mnemonics) ?
-        darm_mnemonics[instr] : NULL;
+        darm_string(darm_mnemonics[instr]) : NULL;
 }
 
 const char *darm_enctype_name(darm_enctype_t enctype)
 {
     return enctype < ARRAYSIZE(darm_enctypes) ?
-        darm_enctypes[enctype] : NULL;
+        darm_string(darm_enctypes[enctype]) : NULL;
+}
+
+const char *darm_error_name(darm_error_t err)
+{
+    static const char *names[] = {
+        "NONE", "LOOKUP", "UNHANDLED", "OPERAND", "INSTR", "FORMAT",
+    };
+    return err < ARRAYSIZE(names) ? names[err] : NULL;
 }
 
 const char *darm_datatype_name(darm_datatype_t dtype){
     return dtype < ARRAYSIZE(darm_datatypes) ?
-        darm_datatypes[dtype] : NULL;
+        darm_string(darm_datatypes[dtype]) : NULL;
 }
 
 const char *darm_any_register_name(darm_reg_t reg, darm_datatype_t dtype){
     if (D_F32 == dtype){
         return reg != R_INVLD && reg < (int32_t) ARRAYSIZE(darm_F32_registers) ?
-            darm_F32_registers[reg] : NULL;
+            darm_string(darm_F32_registers[reg]) : NULL;
     }
     else if (D_F64 == dtype){
         return reg != R_INVLD && reg < (int32_t) ARRAYSIZE(darm_F64_registers) ?
-            darm_F64_registers[reg] : NULL;
+            darm_string(darm_F64_registers[reg]) : NULL;
     }
     return reg != R_INVLD && reg < (int32_t) ARRAYSIZE(darm_registers) ?
-        darm_registers[reg] : NULL;
+        darm_string(darm_registers[reg]) : NULL;
 }
 
 const char *darm_register_name(darm_reg_t reg)
 {
     if(reg >= r0 && reg <= r15) {
-        return darm_registers[reg - r0];
+        return darm_string(darm_registers[reg - r0]);
     }
     if(reg >= s0 && reg <= s31) {
-        return darm_F32_registers[reg - s0];
+        return darm_string(darm_F32_registers[reg - s0]);
     }
     if(reg >= d0 && reg <= d31) {
-        return darm_F64_registers[reg - d0];
+        return darm_string(darm_F64_registers[reg - d0]);
     }
     if(reg >= q0 && reg <= q15) {
-        return darm_F128_registers[reg - q0];
+        return darm_string(darm_F128_registers[reg - q0]);
     }
     return NULL;
 }
@@ -0,0 +1,203 @@
+#define _POSIX_C_SOURCE 199309L
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include "../darm.h"
+
+// usage: bench.exe <arm|thumb> <file> [seconds]
+//
+// decodes the little-endian encoded instructions in file with every
+// function of the native api that applies to the mode, and prints the
+// throughput of each as a json list, see bench/bench.py
+
+static double g_seconds = 0.5;
+
+static double now(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
+// one pass over the input, returns the amount of instructions processed
+typedef size_t (*pass_t)(const uint8_t *buf, size_t len, void *arg);
+
+static int g_first = 1;
+
+static void run(const char *name, pass_t pass, const uint8_t *buf,
+    size_t len, void *arg)
+{
+    size_t count = 0, passes = 0;
+    double start = now(), elapsed;
+
+    // repeat the passes until enough time has passed to be measurable
+    do {
+        count += pass(buf, len, arg);
+        passes++;
+        elapsed = now() - start;
+    } while (elapsed < g_seconds);
+
+    printf("%s\n    {\"name\": \"%s\", \"count\": %lu, \"passes\": %lu, "
+        "\"seconds\": %f, \"per_second\": %f}", g_first ? "" : ",", name,
+        (unsigned long) count, (unsigned long) passes, elapsed,
+        count / elapsed);
+    g_first = 0;
+}
+
+static uint32_t read32(const uint8_t *p)
+{
+    return p[0] | (p[1] << 8) | (p[2] << 16) | ((uint32_t) p[3] << 24);
+}
+
+static size_t armv7_disasm(const uint8_t *buf, size_t len, void *arg)
+{
+    darm_t d; (void) arg;
+    for (size_t off = 0; off + 4 <= len; off += 4) {
+        darm_armv7_disasm(&d, read32(buf + off));
+    }
+    return len / 4;
+}
+
+static size_t thumb_disasm(const uint8_t *buf, size_t len, void *arg)
+{
+    darm_t d; (void) arg;
+    for (size_t off = 0; off + 2 <= len; off += 2) {
+        darm_thumb_disasm(&d, buf[off] | (buf[off+1] << 8));
+    }
+    return len / 2;
+}
+
+static size_t thumb2_disasm(const uint8_t *buf, size_t len, void *arg)
+{
+    darm_t d; size_t count = 0; (void) arg;
+    for (size_t off = 0; off + 2 <= len; count++) {
+        uint16_t w = buf[off] | (buf[off+1] << 8), w2 = 0;
+        if(IS_THUMB2_32BIT(w) && off + 4 <= len) {
+            w2 = buf[off+2] | (buf[off+3] << 8);
+            off += 2;
+        }
+        darm_thumb2_disasm(&d, w, w2);
+        off += 2;
+    }
+    return count;
+}
+
+// the instructions as decoded upfront by darm_disasm_buffer()
+struct decoded {
+    darm_mode_t mode;
+    darm_t *d;
+    size_t count;
+};
+
+static size_t str2(const uint8_t *buf, size_t len, void *arg)
+{
+    struct decoded *x = (struct decoded *) arg;
+    darm_str_t str; size_t count = 0; (void) buf; (void) len;
+
+    for (size_t idx = 0; idx < x->count; idx++) {
+        if(x->d[idx].instr != I_INVLD) {
+            darm_str2(&x->d[idx], &str, 1);
+            count++;
+        }
+    }
+    return count;
+}
+
+static size_t operands(const uint8_t *buf, size_t len, void *arg)
+{
+    struct decoded *x = (struct decoded *) arg;
+    darm_operand_t ops[DARM_MAX_OPERANDS]; size_t count = 0;
+    (void) buf; (void) len;
+
+    for (size_t idx = 0; idx < x->count; idx++) {
+        if(x->d[idx].instr != I_INVLD) {
+            darm_operands(&x->d[idx], ops);
+            count++;
+        }
+    }
+    return count;
+}
+
+static size_t disasm_buffer(const uint8_t *buf, size_t len, void *arg)
+{
+    struct decoded *x = (struct decoded *) arg;
+    return darm_disasm_buffer(x->d, x->count, buf, len, x->mode);
+}
+
+static size_t format_buffer(const uint8_t *buf, size_t len, void *arg)
+{
+    static char out[0x100000];
+    darm_mode_t mode = ((struct decoded *) arg)->mode;
+    size_t off = 0, count = 0;
+
+    while (off < len) {
+        size_t outlen = sizeof(out);
+        size_t used = darm_format_buffer(out, &outlen, buf + off, len - off,
+            mode, off, 1);
+        if(used == 0) break;
+
+        for (size_t idx = 0; idx < outlen; idx++) {
+            count += out[idx] == '\n';
+        }
+        off += used;
+    }
+    return count;
+}
+
+int main(int argc, char *argv[])
+{
+    if(argc < 3 || (strcmp(argv[1], "arm") && strcmp(argv[1], "thumb"))) {
+        fprintf(stderr, "usage: %s <arm|thumb> <file> [seconds]\n", argv[0]);
+        return 1;
+    }
+
+    darm_mode_t mode = strcmp(argv[1], "arm") ? M_THUMB : M_ARM;
+    if(argc > 3) g_seconds = atof(argv[3]);
+
+    FILE *fp = fopen(argv[2], "rb");
+    if(fp == NULL) {
+        fprintf(stderr, "error opening %s..\n", argv[2]);
+        return 1;
+    }
+
+    fseek(fp, 0, SEEK_END);
+    size_t len = ftell(fp);
+    fseek(fp, 0, SEEK_SET);
+
+    uint8_t *buf = (uint8_t *) malloc(len + 1);
+    if(buf == NULL || fread(buf, 1, len, fp) != len) {
+        fprintf(stderr, "error reading %s..\n", argv[2]);
+        return 1;
+    }
+    fclose(fp);
+
+    // the decoders report failures on stderr, which doesn't belong in the
+    // json output, but should still be part of the measurements
+    if(freopen("/dev/null", "w", stderr) == NULL) {
+        return 1;
+    }
+
+    struct decoded x;
+    x.mode = mode;
+    x.d = (darm_t *) malloc(sizeof(darm_t) * (len / 2 + 1));
+    x.count = darm_disasm_buffer(x.d, len / 2 + 1, buf, len, mode);
+
+    printf("[");
+    if(mode == M_ARM) {
+        run("darm_armv7_disasm", &armv7_disasm, buf, len, NULL);
+    }
+    else {
+        run("darm_thumb_disasm", &thumb_disasm, buf, len, NULL);
+        run("darm_thumb2_disasm", &thumb2_disasm, buf, len, NULL);
+    }
+    run("darm_str2", &str2, buf, len, &x);
+    run("darm_operands", &operands, buf, len, &x);
+    run("darm_disasm_buffer", &disasm_buffer, buf, len, &x);
+    run("darm_format_buffer", &format_buffer, buf, len, &x);
+    printf("\n]\n");
+
+    free(x.d);
+    free(buf);
+    return 0;
+}
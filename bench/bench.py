@@ -0,0 +1,287 @@
+"""
+Copyright (c) 2013, Jurriaan Bremer
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the darm developer(s) nor the names of its
+  contributors may be used to endorse or promote products derived from this
+  software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+"""
+import json
+import optparse
+import os
+import platform
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.environ.setdefault('DARM_LIBRARY', os.path.join(root, 'libdarm.so'))
+
+import darm
+
+timer = getattr(time, 'perf_counter', time.time)
+
+# instructions as typically emitted by compilers, with a rough weight of how
+# common each of them is
+common_arm = [
+    (0xe92d4010, 4), (0xe8bd8010, 4), (0xe12fff1e, 3), (0xeb000123, 8),
+    (0xe59f0010, 6), (0xe5930000, 8), (0xe5830004, 6), (0xe1a00004, 8),
+    (0xe3a00000, 6), (0xe2800001, 5), (0xe0800001, 4), (0xe3500000, 5),
+    (0x1a000005, 4), (0x0a000003, 4), (0xe2400001, 3), (0xe1500001, 3),
+    (0xe0010092, 1), (0xe3130001, 2), (0xe1d320b4, 2), (0xe5d32000, 3),
+]
+
+# thumb2 instructions are given as (first halfword, second halfword)
+common_thumb = [
+    (0xb510, 4), (0xbd10, 4), (0x4770, 3), (0x2000, 6), (0x4601, 8),
+    (0x6818, 8), (0x6058, 6), (0x3001, 5), (0x2800, 5), (0xd1fe, 4),
+    (0xe7fe, 3), (0x4a03, 5), (0x1c40, 3), (0x0080, 3), (0x9801, 4),
+    (0x7818, 3), (0x4288, 3), ((0xf000, 0xf800), 8), ((0xe92d, 0x4ff0), 2),
+    ((0xe8bd, 0x8ff0), 2), ((0xf8d0, 0x0000), 3), ((0xf8c0, 0x1004), 2),
+]
+
+
+def _weighted(rand, table, count):
+    population = []
+    for value, weight in table:
+        population += [value] * weight
+    return [rand.choice(population) for _ in range(count)]
+
+
+def _pack_thumb(values):
+    halfwords = []
+    for value in values:
+        halfwords += value if isinstance(value, tuple) else [value]
+    return struct.pack('<%dH' % len(halfwords), *halfwords)
+
+
+def mixes(count, seed):
+    """Returns a list of (name, mode, buffer) tuples of count instructions
+    each: random words, random words that decode, and common instructions.
+
+    """
+    rand = random.Random(seed)
+
+    words = [rand.getrandbits(32) for _ in range(count)]
+    yield 'random', 'arm', struct.pack('<%dI' % count, *words)
+
+    halfwords = [rand.getrandbits(16) for _ in range(count)]
+    yield 'random', 'thumb', struct.pack('<%dH' % count, *halfwords)
+
+    valid = []
+    while len(valid) < count:
+        w = rand.getrandbits(32)
+        if darm.disasm(w) is not None:
+            valid.append(w)
+    yield 'valid', 'arm', struct.pack('<%dI' % count, *valid)
+
+    valid = []
+    while len(valid) < count:
+        w, w2 = rand.getrandbits(16), rand.getrandbits(16)
+        if darm.disasm_thumb2(w, w2) is not None:
+            valid.append((w, w2) if darm._is_thumb2_32bit(w) else w)
+    yield 'valid', 'thumb', _pack_thumb(valid)
+
+    words = _weighted(rand, common_arm, count)
+    yield 'common', 'arm', struct.pack('<%dI' % count, *words)
+
+    yield 'common', 'thumb', _pack_thumb(_weighted(rand, common_thumb, count))
+
+
+def measure(func, seconds):
+    """Calls func, which returns the amount of instructions it processed,
+    until enough time has passed to be measurable."""
+    count = passes = elapsed = 0
+    while elapsed < seconds:
+        start = timer()
+        count += func()
+        elapsed += timer() - start
+        passes += 1
+    return dict(count=count, passes=passes, seconds=elapsed,
+                per_second=count / elapsed)
+
+
+def python_benchmarks(mode, buf, seconds):
+    """Benchmarks of the python bindings."""
+    ret = []
+
+    if mode == 'arm':
+        words = struct.unpack('<%dI' % (len(buf) // 4), buf)
+
+        def decode():
+            for w in words:
+                darm.disasm(w)
+            return len(words)
+        ret.append(('darm.disasm', decode))
+    else:
+        halfwords = struct.unpack('<%dH' % (len(buf) // 2), buf)
+
+        def decode():
+            for w in halfwords:
+                darm.disasm_thumb(w)
+            return len(halfwords)
+        ret.append(('darm.disasm_thumb', decode))
+
+        def decode2():
+            off = count = 0
+            while off < len(halfwords):
+                w = halfwords[off]
+                if darm._is_thumb2_32bit(w) and off + 1 < len(halfwords):
+                    darm.disasm_thumb2(w, halfwords[off + 1])
+                    off += 2
+                else:
+                    darm.disasm_thumb2(w)
+                    off += 1
+                count += 1
+            return count
+        ret.append(('darm.disasm_thumb2', decode2))
+
+    rows = [d.d for _, d in darm.disasm_buffer(buf, mode) if d is not None]
+
+    def render():
+        # the string representation is memoized, so use new objects
+        for d in [darm.Darm(x) for x in rows]:
+            str(d)
+        return len(rows)
+    ret.append(('Darm.__str__', render))
+
+    def operands():
+        for d in [darm.Darm(x) for x in rows]:
+            d.operands
+        return len(rows)
+    ret.append(('Darm.operands', operands))
+
+    ret.append(('darm.disasm_buffer',
+                lambda: len(darm.disasm_buffer(buf, mode))))
+
+    # the Darm objects of disasm_buffer are created on access
+    ret.append(('list(darm.disasm_buffer)',
+                lambda: len(list(darm.disasm_buffer(buf, mode)))))
+
+    if darm.numpy is not None:
+        ret.append(('darm.disasm_array',
+                    lambda: len(darm.disasm_array(buf, mode))))
+
+    ret.append(('darm.format_buffer',
+                lambda: darm.format_buffer(buf, mode).count('\n')))
+
+    return [dict(name=name, **measure(func, seconds)) for name, func in ret]
+
+
+def native_benchmarks(mode, buf, seconds):
+    """Benchmarks of libdarm itself, through bench/bench.exe."""
+    exe = os.path.join(root, 'bench', 'bench.exe')
+    if not os.path.exists(exe):
+        return []
+
+    fd, path = tempfile.mkstemp()
+    try:
+        os.write(fd, buf)
+        os.close(fd)
+        output = subprocess.check_output([exe, mode, path, str(seconds)])
+    finally:
+        os.unlink(path)
+    return json.loads(output.decode('utf8'))
+
+
+def generator_benchmark(python):
+    """Time it takes darmgen.py to generate the tables."""
+    tmp = tempfile.mkdtemp()
+    try:
+        for fname in os.listdir(root):
+            if fname.endswith('.py') or fname == 'instructions.txt':
+                shutil.copy(os.path.join(root, fname), tmp)
+
+        devnull = open(os.devnull, 'w')
+        try:
+            start = timer()
+            subprocess.check_call([python, 'darmgen.py'], cwd=tmp,
+                                  stdout=devnull)
+            elapsed = timer() - start
+        finally:
+            devnull.close()
+        return dict(name='darmgen.py', count=1, passes=1, seconds=elapsed)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('-t', '--seconds', type='float', default=0.5,
+                      help='minimum time to spend on each benchmark')
+    parser.add_option('-n', '--count', type='int', default=0x4000,
+                      help='amount of instructions in each generated mix')
+    parser.add_option('-s', '--seed', type='int', default=0x13371337,
+                      help='seed for the generated mixes')
+    parser.add_option('-f', '--file', action='append', default=[],
+                      metavar='PATH:MODE',
+                      help='additionally benchmark the contents of a file')
+    parser.add_option('-g', '--generator', action='store_true',
+                      help='also measure the time darmgen.py takes')
+    parser.add_option('--python', default='python',
+                      help='interpreter to run darmgen.py with')
+    options, args = parser.parse_args()
+
+    # the decoders report failures on stderr, which is silenced here rather
+    # than being excluded from the measurements
+    stderr = os.dup(2)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 2)
+
+    try:
+        inputs = list(mixes(options.count, options.seed))
+        for arg in options.file:
+            path, mode = arg.rsplit(':', 1)
+            inputs.append((path, mode, open(path, 'rb').read()))
+
+        results = []
+        for name, mode, buf in inputs:
+            for kind, func in (('python', python_benchmarks),
+                               ('native', native_benchmarks)):
+                for row in func(mode, buf, options.seconds):
+                    row.update(kind=kind, mix=name, mode=mode)
+                    results.append(row)
+
+        if options.generator:
+            row = generator_benchmark(options.python)
+            row.update(kind='generator')
+            results.append(row)
+    finally:
+        os.dup2(stderr, 2)
+        os.close(devnull)
+        os.close(stderr)
+
+    meta = dict(python=platform.python_version(), platform=platform.platform(),
+                numpy=darm.numpy is not None, seed=options.seed,
+                count=options.count, time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    json.dump(dict(meta=meta, results=results), sys.stdout, indent=2,
+              sort_keys=True)
+    sys.stdout.write('\n')
+
+if __name__ == '__main__':
+    main()
@@ -28,9 +28,10 @@ POSSIBILITY OF SUCH DAMAGE.
 */
 
 #include <stdio.h>
-#include <ctype.h>
 #include <stdint.h>
+#include <string.h>
 #include <assert.h>
+#include <time.h>
 
 #include "darm.h"
 
@@ -59,22 +60,99 @@ int utoa(unsigned int value, char *out, int base)
     return counter;
 }
 
+// rotate, imm, shift, lsb, width, reglist, ext_registers, cpsr and mode are
+// zero, as are w, size and cond, which the decoders fill in
+const darm_t darm_invalid = {
+    .instr = I_INVLD, .instr_type = T_INVLD,
+    .shift_type = S_INVLD, .option = O_INVLD,
+    .S = B_INVLD, .E = B_INVLD, .U = B_INVLD, .H = B_INVLD, .P = B_INVLD,
+    .I = B_INVLD, .R = B_INVLD, .T = B_INVLD, .W = B_INVLD, .M = B_INVLD,
+    .N = B_INVLD, .B = B_INVLD,
+    .dtype = D_INVLD, .stype = D_INVLD,
+    .Rd = R_INVLD, .Rn = R_INVLD, .Rm = R_INVLD, .Ra = R_INVLD,
+    .Rt = R_INVLD, .Rt2 = R_INVLD, .RdHi = R_INVLD, .RdLo = R_INVLD,
+    .Rs = R_INVLD,
+};
+
 int32_t sign_ext32(int32_t v, uint32_t len){
     return ((v << (32 - len)) >> (32 - len));
 }
 
-int darm_str(const darm_t *d, darm_str_t *str)
+// the program the format strings of an instruction compile to, see
+// FormatPool in darmgen.py, or NULL if there is none
+static const uint8_t *format_program(const darm_t *d, const char *caller)
 {
+    uint16_t format = 0;
+
     if(d->instr == I_INVLD || d->instr >= ARRAYSIZE(darm_mnemonics)) {
-        fprintf(stderr, "darm_str: invalid instruction\n");
-        return -1;
+        DARM_ERROR(E_INSTR, "%s: invalid instruction\n", caller);
+        return NULL;
     }
 
-    // the format string index (armv7 only)
-    uint32_t idx = 0;
+    switch (d->mode){
+    case M_ARM:
+        format = armv7_formats[d->instr];
+        break;
+    case M_THUMB:
+        format = THUMB_INSTR_LOOKUP(d->w).format;
+        break;
+    case M_THUMB2_16:
+        format = THUMB2_16_INSTR_LOOKUP(d->w).format;
+        break;
+    case M_THUMB2:
+        format = THUMB2_INSTR_LOOKUP(d->w).format;
+        break;
+    case M_ARM_VFP:
+        if(IS_ARM_VFP_DPI(d->w)) {
+            format = ARM_VFP_DPI_LOOKUP(d->w).format;
+        } else if(IS_ARM_VFP_LDST(d->w)) {
+            format = ARM_VFP_LDST_LOOKUP(d->w).format;
+        } else assert(0);
+        break;
+    case M_ARM_NEON:
+        if(IS_ARM_SIMD_DPI(d->w)) {
+            format = ARM_NEON_DPI_LOOKUP(d->w).format;
+        } else if(IS_ARM_SIMD_LDST(d->w)) {
+            format = ARM_NEON_LDST_LOOKUP(d->w).format;
+        } else assert(0);
+        break;
+    case M_THUMB2_VFP:
+        if(IS_THUMB_VFP_DPI(d->w)) {
+            format = THUMB_VFP_DPI_LOOKUP(d->w).format;
+        } else if(IS_THUMB_VFP_LDST(d->w)) {
+            format = THUMB_VFP_LDST_LOOKUP(d->w).format;
+        } else assert(0);
+        break;
+    case M_THUMB2_NEON:
+        if(IS_THUMB_SIMD_DPI(d->w)) {
+            format = THUMB_NEON_DPI_LOOKUP(d->w).format;
+        } else if(IS_THUMB_SIMD_LDST(d->w)) {
+            format = THUMB_NEON_LDST_LOOKUP(d->w).format;
+        } else assert(0);
+        break;
+    default:
+        DARM_ERROR(E_INSTR, "%s: invalid mode %u\n", caller, d->mode);
+        return NULL;
+    }
+    if(format == 0) {
+        DARM_ERROR(E_FORMAT, "%s: no format for mode %u\n", caller, d->mode);
+        return NULL;
+    }
+    return &darm_formats[format];
+}
 
-    // the offset in the format string
-    uint32_t off = 0;
+int darm_str(const darm_t *d, darm_str_t *str)
+{
+#if DARM_THUMB_TABLE == DARM_THUMB_TABLE_FULL
+    if(d->mode == M_THUMB && darm_thumb_str(d, str) == 0) {
+        return 0;
+    }
+#endif
+
+    const uint8_t *program = format_program(d, "darm_str"), *pc = program;
+    if(program == NULL) {
+        return -1;
+    }
 
     // argument index
     uint32_t arg = 0;
@@ -84,72 +162,15 @@ int darm_str(const darm_t *d, darm_str_t *str)
 
     char *shift = str->shift;
 
-    // format tracking
-    const char** ptrs = NULL;
-    const char* phony[3];
-
     // ptr to the output mnemonic
     char *mnemonic = str->mnemonic;
     APPEND(mnemonic, darm_mnemonic_name(d->instr));
 
-    if(M_ARM != d->mode){
-        for (idx = 0; idx < 3; idx++){
-            phony[idx] = NULL;
-        }
-
-        switch (d->mode){
-        case M_THUMB:
-            phony[0] = THUMB_INSTR_LOOKUP(d->w).format;
-            break;
-        case M_THUMB2_16:
-            phony[0] = THUMB2_16_INSTR_LOOKUP(d->w).format;
-            break;
-        case M_THUMB2:
-            phony[0] = THUMB2_INSTR_LOOKUP(d->w).format;
-            break;
-        case M_ARM_VFP:
-            if(IS_ARM_VFP_DPI(d->w)) {
-                phony[0] = ARM_VFP_DPI_LOOKUP(d->w).format;
-            } else if(IS_ARM_VFP_LDST(d->w)) {
-                phony[0] = ARM_VFP_LDST_LOOKUP(d->w).format;
-            } else assert(0);
-            break;
-        case M_ARM_NEON:
-            if(IS_ARM_SIMD_DPI(d->w)) {
-                phony[0] = ARM_NEON_DPI_LOOKUP(d->w).format;
-            } else if(IS_ARM_SIMD_LDST(d->w)) {
-                phony[0] = ARM_NEON_LDST_LOOKUP(d->w).format;
-            } else assert(0);
-        case M_THUMB2_VFP:
-            if(IS_THUMB_VFP_DPI(d->w)) {
-                phony[0] = THUMB_VFP_DPI_LOOKUP(d->w).format;
-            } else if(IS_THUMB_VFP_LDST(d->w)) {
-                phony[0] = THUMB_VFP_LDST_LOOKUP(d->w).format;
-            } else assert(0);
-            break;
-        case M_THUMB2_NEON:
-            if(IS_THUMB_SIMD_DPI(d->w)) {
-                phony[0] = THUMB_NEON_DPI_LOOKUP(d->w).format;
-            } else if(IS_THUMB_SIMD_LDST(d->w)) {
-                phony[0] = THUMB_NEON_LDST_LOOKUP(d->w).format;
-            } else assert(0);
-            break;
-        default:
-            fprintf(stderr, "darm_str: invalid mode %u\n", d->mode);
-            return -1;
-        }
-        ptrs = phony;
-        idx = 0;
-    } else
-        ptrs = armv7_format_strings[d->instr];
-    if(ptrs[0] == NULL) {
-        fprintf(stderr, "darm_str: no format for mode %u\n", d->mode);
-        return -1;
-    }
-    //printf("format is %s\n", ptrs[0]);
+    // the operands which may be missing are followed by the offset in the
+    // program to continue at if they are
+    uint8_t missing = 0;
 
-    for (char ch; (ch = ptrs[idx][off]) != 0; off++) {
-        //printf("got %c %d\n", ch, ch);
+    for (uint8_t ch; (ch = *pc++) != 0; ) {
         switch (ch) {
         case 'D':
             APPEND(mnemonic, ".");
@@ -172,24 +193,28 @@ int darm_str(const darm_t *d, darm_str_t *str)
             continue;
 
         case 'd':
+            missing = *pc++;
             if(d->Rd == R_INVLD) break;
             APPEND(args[arg], darm_any_register_name(d->Rd, d->dtype));
             arg++;
             continue;
 
         case 'n':
+            missing = *pc++;
             if(d->Rn == R_INVLD) break;
             APPEND(args[arg], darm_any_register_name(d->Rn, (d->dtype == d->stype)? d->dtype: d->stype));
             arg++;
             continue;
 
         case 'm':
+            missing = *pc++;
             if(d->Rm == R_INVLD) break;
             APPEND(args[arg], darm_any_register_name(d->Rm, (d->dtype == d->stype)? d->dtype: d->stype));
             arg++;
             continue;
 
         case '1':
+            missing = *pc++;
             // always Rm+1
             if(d->Rm == R_INVLD) break;
             APPEND(args[arg], darm_register_name(d->Rm + 1));
@@ -197,18 +222,21 @@ int darm_str(const darm_t *d, darm_str_t *str)
             continue;
 
         case 'a':
+            missing = *pc++;
             if(d->Ra == R_INVLD) break;
             APPEND(args[arg], darm_register_name(d->Ra));
             arg++;
             continue;
 
         case 't':
+            missing = *pc++;
             if(d->Rt == R_INVLD) break;
             APPEND(args[arg], darm_register_name(d->Rt));
             arg++;
             continue;
 
         case '2':
+            missing = *pc++;
             // first check if Rt2 is actually set
             if(d->Rt2 != R_INVLD) {
                 APPEND(args[arg], darm_register_name(d->Rt2));
@@ -224,18 +252,21 @@ int darm_str(const darm_t *d, darm_str_t *str)
             break;
 
         case 'h':
+            missing = *pc++;
             if(d->RdHi == R_INVLD) break;
             APPEND(args[arg], darm_register_name(d->RdHi));
             arg++;
             continue;
 
         case 'l':
+            missing = *pc++;
             if(d->RdLo == R_INVLD) break;
             APPEND(args[arg], darm_register_name(d->RdLo));
             arg++;
             continue;
 
         case 'i':
+            missing = *pc++;
             // check if an immediate has been set
             if(d->I != B_SET) break;
 
@@ -294,7 +325,7 @@ int darm_str(const darm_t *d, darm_str_t *str)
             continue;
 
         case '!':
-            if(d->W == B_SET) {
+            if(d->W == B_SET && arg != 0) {
                 *args[arg-1]++ = '!';
             }
             continue;
@@ -310,6 +341,7 @@ int darm_str(const darm_t *d, darm_str_t *str)
             continue;
 
         case 'X':
+            missing = *pc++;
             // if the flags are not set, then this instruction doesn't take
             // the (B|T)(B|T) postfix
             if(d->N == B_INVLD || d->M == B_INVLD) break;
@@ -402,7 +434,7 @@ int darm_str(const darm_t *d, darm_str_t *str)
                 APPEND(args[arg], d->U == B_UNSET ? "#-0x" : "#0x");
                 args[arg] += utoa(d->imm, args[arg], 16);
             }
-            else {
+            else if(d->P == B_SET) {
                 // there's no immediate, so we have to remove the ", " which
                 // was introduced by the base register of the memory address
                 args[arg] -= 2;
@@ -416,6 +448,7 @@ int darm_str(const darm_t *d, darm_str_t *str)
             continue;
 
         case 'b':
+            missing = *pc++;
             // BLX first checks for branch and only then for the conditional
             // version which takes the Rm as operand, so let's see if the
             // branch stuff has been initialized yet
@@ -462,31 +495,17 @@ int darm_str(const darm_t *d, darm_str_t *str)
             }
             continue;
 
-            // TODO: for TBB/TBH print these outside all args?
-        case '[':
-        case ']':
-        case ':':
-        case '{':
-        case '}':
-        case '6':
-        case '4':
-        case '#':
-        case '-':
-            continue;
+        case '?':
+            DARM_ERROR(E_FORMAT, "darm_str: ???\n");
+            return -1;
 
         default:
-            fprintf(stderr, "darm_str: malformed format: %c of %s for %s\n", ch, ptrs[0], darm_mnemonic_name(d->instr));
+            DARM_ERROR(E_FORMAT, "darm_str: malformed format: %c for %s\n", ch, darm_mnemonic_name(d->instr));
             return -1;
         }
 
-        // TODO: anything but armv7
-        if (M_ARM != d->mode) break;
-
-        if(ptrs[++idx] == NULL || idx == 3) {
-            fprintf(stderr, "darm_str: ???\n");
-            return -1;
-        }
-        off--;
+        // the operand is missing, continue with the next alternative
+        pc = program + missing;
     }
 
     *mnemonic = *args[0] = *args[1] = *args[2] = *args[3] = *shift = 0;
@@ -517,15 +536,308 @@ int darm_str2(const darm_t *d, darm_str_t *str, int lowercase)
     }
 
     if(lowercase != 0) {
-        // just lowercase the entire object, including null-bytes
-        char *buf = (char *) str;
-        for (uint32_t i = 0; i < sizeof(darm_str_t); i++) {
-            buf[i] = tolower(buf[i]);
+        // only the strings themselves, rather than the entire object
+        char *fields[] = {
+            str->mnemonic, str->arg[0], str->arg[1], str->arg[2],
+            str->arg[3], str->shift, str->instr,
+        };
+        for (uint32_t i = 0; i < ARRAYSIZE(fields); i++) {
+            for (char *p = fields[i]; *p != 0; p++) {
+                if(*p >= 'A' && *p <= 'Z') *p += 'a' - 'A';
+            }
         }
     }
     return 0;
 }
 
+// the register as named by darm_any_register_name()
+static darm_reg_t any_register(darm_reg_t reg, darm_datatype_t dtype)
+{
+    if(reg == R_INVLD || darm_any_register_name(reg, dtype) == NULL) {
+        return R_INVLD;
+    }
+    if(dtype == D_F32) return s0 + reg;
+    if(dtype == D_F64) return d0 + reg;
+    return reg;
+}
+
+// the register as named by darm_register_name()
+static darm_reg_t register_operand(darm_reg_t reg)
+{
+    return darm_register_name(reg) != NULL ? reg : R_INVLD;
+}
+
+static void set_register(darm_operand_t *op, darm_reg_t reg)
+{
+    // darm_str() renders an empty argument for unnamed registers, which
+    // ends its list of arguments
+    if(reg != R_INVLD) {
+        op->type = OP_REG;
+        op->reg = reg;
+    }
+}
+
+static void set_immediate(darm_operand_t *op, uint32_t imm)
+{
+    op->type = OP_IMM;
+    op->imm = imm;
+}
+
+static void set_shift(darm_operand_t *op, const darm_t *d)
+{
+    const char *type; uint32_t imm;
+
+    op->shift_type = d->shift_type;
+    if(d->Rs != R_INVLD) {
+        op->Rs = d->Rs;
+    }
+    else if(darm_immshift_decode(d, &type, &imm) == 0) {
+        op->shift = imm;
+    }
+}
+
+int darm_operands(const darm_t *d, darm_operand_t *ops)
+{
+    static const darm_operand_t invalid = {
+        .type = OP_INVLD, .reg = R_INVLD, .index = R_INVLD,
+        .shift_type = S_INVLD, .Rs = R_INVLD,
+    };
+
+    const uint8_t *program = format_program(d, "darm_operands"), *pc = program;
+    if(program == NULL) {
+        return -1;
+    }
+
+    // the operands follow the arguments of darm_str(), the shift which it
+    // renders after them is kept apart until the end
+    darm_operand_t shift = invalid;
+    uint32_t arg = 0, count = 0;
+
+    for (uint32_t i = 0; i < DARM_MAX_OPERANDS; i++) {
+        ops[i] = invalid;
+    }
+
+    uint8_t missing = 0;
+
+    for (uint8_t ch; (ch = *pc++) != 0; ) {
+        switch (ch) {
+        case 'D': case 'Y': case 's': case 'c': case 'x': case 'R':
+        case 'T': case 'W':
+            // these only affect the mnemonic
+            continue;
+
+        case 'X':
+            missing = *pc++;
+            if(d->N == B_INVLD || d->M == B_INVLD) break;
+            continue;
+
+        case 'd':
+            missing = *pc++;
+            if(d->Rd == R_INVLD) break;
+            set_register(&ops[arg++], any_register(d->Rd, d->dtype));
+            continue;
+
+        case 'n':
+            missing = *pc++;
+            if(d->Rn == R_INVLD) break;
+            set_register(&ops[arg++], any_register(d->Rn, d->stype));
+            continue;
+
+        case 'm':
+            missing = *pc++;
+            if(d->Rm == R_INVLD) break;
+            set_register(&ops[arg++], any_register(d->Rm, d->stype));
+            continue;
+
+        case '1':
+            missing = *pc++;
+            if(d->Rm == R_INVLD) break;
+            set_register(&ops[arg++], register_operand(d->Rm + 1));
+            continue;
+
+        case 'a':
+            missing = *pc++;
+            if(d->Ra == R_INVLD) break;
+            set_register(&ops[arg++], register_operand(d->Ra));
+            continue;
+
+        case 't':
+            missing = *pc++;
+            if(d->Rt == R_INVLD) break;
+            set_register(&ops[arg++], register_operand(d->Rt));
+            continue;
+
+        case '2':
+            missing = *pc++;
+            if(d->Rt2 != R_INVLD) {
+                set_register(&ops[arg++], register_operand(d->Rt2));
+                continue;
+            }
+            else if(d->Rt != R_INVLD) {
+                set_register(&ops[arg++], register_operand(d->Rt + 1));
+                continue;
+            }
+            break;
+
+        case 'h':
+            missing = *pc++;
+            if(d->RdHi == R_INVLD) break;
+            set_register(&ops[arg++], register_operand(d->RdHi));
+            continue;
+
+        case 'l':
+            missing = *pc++;
+            if(d->RdLo == R_INVLD) break;
+            set_register(&ops[arg++], register_operand(d->RdLo));
+            continue;
+
+        case 'i':
+            missing = *pc++;
+            if(d->I != B_SET) break;
+            set_immediate(&ops[arg++], d->imm);
+            continue;
+
+        case 'S':
+            if(d->shift_type == S_INVLD) continue;
+
+            // a pre-indexed memory address is still open
+            set_shift(d->P == B_SET ? &ops[arg] : &shift, d);
+            if(d->P != B_SET) {
+                shift.type = OP_SHIFT;
+            }
+            continue;
+
+        case '!':
+            if(d->W == B_SET && arg != 0) {
+                ops[arg-1].writeback = 1;
+            }
+            continue;
+
+        case 'e':
+            set_immediate(&ops[arg], d->E);
+            continue;
+
+        case 'r':
+            ops[arg].type = OP_REGLIST;
+            if(d->ext_registers != 0) {
+                ops[arg].reg = d->Rd;
+                ops[arg].count = d->ext_registers;
+            }
+            else if(d->reglist != 0) {
+                ops[arg].reglist = d->reglist;
+            }
+            else {
+                ops[arg].reg = register_operand(d->Rt);
+                ops[arg].count = ops[arg].reg != R_INVLD;
+            }
+            continue;
+
+        case 'L':
+            set_immediate(&ops[arg++], d->lsb);
+            continue;
+
+        case 'w':
+            set_immediate(&ops[arg++], d->width);
+            continue;
+
+        case 'o':
+            set_immediate(&ops[arg++], d->option);
+            continue;
+
+        case 'B':
+            ops[arg].type = OP_MEM;
+            ops[arg].reg = register_operand(d->Rn);
+
+            // post-indexed addressing always writes back to the base
+            ops[arg].writeback = d->P == B_UNSET || d->W == B_SET;
+
+            // post-indexed, the offset is the next operand
+            if(d->P != B_SET) {
+                arg++;
+            }
+            continue;
+
+        case 'O':
+            if(d->Rm != R_INVLD) {
+                if(d->P == B_SET) {
+                    ops[arg].index = any_register(d->Rm, d->dtype);
+                }
+                else {
+                    set_register(&ops[arg], any_register(d->Rm, d->dtype));
+                }
+                ops[arg].subtract = d->U == B_UNSET;
+
+                if(d->P == B_UNSET) {
+                    arg++;
+                }
+            }
+            else if(d->imm != 0) {
+                if(d->P != B_SET) {
+                    ops[arg].type = OP_IMM;
+                }
+                ops[arg].imm = d->imm;
+                ops[arg].subtract = d->U == B_UNSET;
+            }
+            continue;
+
+        case 'b':
+            missing = *pc++;
+            if(d->instr == I_BLX && d->H == B_INVLD) break;
+            set_immediate(&ops[arg], d->imm);
+            continue;
+
+        case 'M':
+            ops[arg].type = OP_MEM;
+            ops[arg].reg = register_operand(d->Rn);
+            ops[arg].subtract = d->U == B_UNSET;
+            ops[arg].writeback = d->P == B_UNSET || d->W == B_SET;
+
+            if(d->Rm != R_INVLD) {
+                const char *type; uint32_t imm;
+                ops[arg].index = register_operand(d->Rm);
+                if(darm_immshift_decode(d, &type, &imm) == 0) {
+                    ops[arg].shift_type = d->shift_type;
+                    ops[arg].shift = imm;
+                }
+            }
+            else {
+                ops[arg].imm = d->imm;
+            }
+            continue;
+
+        case 'A':
+            if(d->rotate != 0) {
+                ops[arg].type = OP_SHIFT;
+                ops[arg].shift_type = S_ROR;
+                ops[arg].shift = d->rotate;
+            }
+            continue;
+
+        case '?':
+            DARM_ERROR(E_FORMAT, "darm_operands: ???\n");
+            return -1;
+
+        default:
+            DARM_ERROR(E_FORMAT, "darm_operands: malformed format: %c for %s\n", ch, darm_mnemonic_name(d->instr));
+            return -1;
+        }
+
+        // the operand is missing, continue with the next alternative
+        pc = program + missing;
+    }
+
+    // like the arguments of darm_str(), the operands end at the first one
+    // that's missing
+    while (count < 4 && ops[count].type != OP_INVLD) {
+        count++;
+    }
+
+    if(shift.type != OP_INVLD) {
+        ops[count++] = shift;
+    }
+    return count;
+}
+
 int darm_extension_reglist(darm_t* d, char *out)
 {
     assert(d->ext_registers > 0);
@@ -562,8 +874,9 @@ int darm_reglist(uint16_t reglist, char *out)
         int32_t reg, start = __builtin_ctz(reglist);
 
         // most registers have length two
-        *(uint16_t *) out = *(uint16_t *) darm_registers[start];
-        out[2] = darm_registers[start][2];
+        const char *name = darm_string(darm_registers[start]);
+        *(uint16_t *) out = *(uint16_t *) name;
+        out[2] = name[2];
         out += 2 + (out[2] != 0);
 
         for (reg = start; reg == __builtin_ctz(reglist); reg++) {
@@ -578,8 +891,9 @@ int darm_reglist(uint16_t reglist, char *out)
             // registers have been found, but we prefer the notation
             // {r0,r1} over {r0-r1} in that case
             *out++ = reg == start + 2 ? ',' : '-';
-            *(uint16_t *) out = *(uint16_t *) darm_registers[reg-1];
-            out[2] = darm_registers[reg-1][2];
+            name = darm_string(darm_registers[reg-1]);
+            *(uint16_t *) out = *(uint16_t *) name;
+            out[2] = name[2];
             out += 2 + (out[2] != 0);
         }
         *out++ = ',';
@@ -693,8 +1007,321 @@ void darm_dump(const darm_t *d)
     printf("\n");
 }
 
+// decode an instruction that was read from a buffer
+static void disasm_word(darm_t *d, uint32_t w, uint32_t size,
+    darm_mode_t mode)
+{
+    int ret;
+
+    if(mode == M_ARM) {
+        ret = darm_armv7_disasm(d, w);
+    }
+    else if(size == 4) {
+        ret = darm_thumb2_disasm(d, w >> 16, w & 0xffff);
+    }
+    else {
+        ret = darm_thumb2_disasm(d, w, 0);
+    }
+
+    // when failing, some info might still be set, so we explicitly mark
+    // this instruction as being invalid
+    if(ret < 0) {
+        d->w = w;
+        d->instr = I_INVLD;
+    }
+    d->size = size;
+}
+
+// read the next instruction from a buffer, returns its length in bytes, or
+// zero if the buffer is too short to contain it
+static uint32_t read_word(uint32_t *w, const uint8_t *buf, size_t len,
+    darm_mode_t mode)
+{
+    if(mode == M_ARM) {
+        if(len < 4) return 0;
+
+        *w = buf[0] | (buf[1] << 8) | (buf[2] << 16) |
+            ((uint32_t) buf[3] << 24);
+        return 4;
+    }
+
+    if(len < 2) return 0;
+
+    *w = buf[0] | (buf[1] << 8);
+    if(IS_THUMB2_32BIT(*w) == 0) return 2;
+
+    // the second halfword of this instruction is not available
+    if(len < 4) return 0;
+
+    *w = (*w << 16) | buf[2] | (buf[3] << 8);
+    return 4;
+}
+
+uint32_t darm_thumb2_disasm_bytes(darm_t *d, const uint8_t *buf, size_t len)
+{
+    uint32_t w, size = read_word(&w, buf, len, M_THUMB);
+    if(size != 0) {
+        disasm_word(d, w, size, M_THUMB);
+    }
+    return size;
+}
+
+static int g_quiet;
+static uint64_t g_errors[E_ERRCNT];
+static __thread darm_error_t g_last_error;
+
+// the failures of the calling thread since darm_disasm_buffer_cached()
+// started decoding an instruction that it's going to cache
+static __thread uint8_t g_cache_errors[E_ERRCNT];
+
+static void cache_error(const darm_cache_entry_t *e, darm_error_t err)
+{
+    for (uint32_t count = e->errors[err]; count != 0; count--) {
+        DARM_ERROR(err, "darm_disasm_buffer_cached: %s error for 0x%08x\n",
+            darm_error_name(err), e->w);
+    }
+}
+
+// report the failures of a cached instruction again, the last one last
+static void cache_errors(const darm_cache_entry_t *e)
+{
+    for (uint32_t err = E_NONE + 1; err < E_ERRCNT; err++) {
+        if(err != e->error) {
+            cache_error(e, err);
+        }
+    }
+    cache_error(e, e->error);
+}
+
+size_t darm_disasm_buffer(darm_t *d, size_t count, const uint8_t *buf,
+    size_t len, darm_mode_t mode)
+{
+    return darm_disasm_buffer_cached(d, count, buf, len, mode, NULL);
+}
+
+size_t darm_buffer_count(const uint8_t *buf, size_t len, darm_mode_t mode,
+    size_t *end)
+{
+    size_t count = 0, off = 0;
+    uint32_t w, size;
+
+    if(mode == M_ARM || mode == M_THUMB) {
+        while ((size = read_word(&w, buf + off, len - off, mode)) != 0) {
+            off += size, count++;
+        }
+    }
+
+    if(end != NULL) {
+        *end = off;
+    }
+    return count;
+}
+
+int darm_cache_init(darm_cache_t *cache, darm_cache_entry_t *entries,
+    uint32_t count)
+{
+    // entries are indexed by masking the hash of the instruction
+    if(count == 0 || (count & (count - 1)) != 0) {
+        entries = NULL, count = 0;
+    }
+
+    cache->entries = entries;
+    cache->count = count;
+    cache->hits = cache->misses = cache->evictions = 0;
+
+    for (uint32_t idx = 0; idx < count; idx++) {
+        entries[idx].mode = -1;
+    }
+    return entries != NULL ? 0 : -1;
+}
+
+size_t darm_disasm_buffer_cached(darm_t *d, size_t count, const uint8_t *buf,
+    size_t len, darm_mode_t mode, darm_cache_t *cache)
+{
+    size_t idx, off = 0;
+
+    if(mode != M_ARM && mode != M_THUMB) return 0;
+
+    for (idx = 0; idx < count; idx++, d++) {
+        uint32_t w, size = read_word(&w, buf + off, len - off, mode);
+        if(size == 0) break;
+
+        off += size;
+
+        if(cache == NULL || cache->count == 0) {
+            disasm_word(d, w, size, mode);
+            continue;
+        }
+
+        uint32_t h = w * 0x9e3779b1;
+        darm_cache_entry_t *e =
+            &cache->entries[(h ^ (h >> 16)) & (cache->count - 1)];
+
+        if(e->w == w && e->mode == (int32_t) mode) {
+#ifdef DARM_STATS
+            uint64_t start = darm_stats_clock();
+#endif
+            *d = e->d;
+            cache->hits++;
+
+            // the counters don't depend on whether the cache is used, so
+            // hits are accounted for as if they were decoded again
+            if(e->error != E_NONE) {
+                cache_errors(e);
+            }
+#ifdef DARM_STATS
+            darm_stats_record(d, d->instr == I_INVLD ? -1 : 0,
+                darm_stats_clock() - start);
+#endif
+            continue;
+        }
+
+        cache->misses++;
+        if(e->mode != -1) {
+            cache->evictions++;
+        }
+
+        darm_error_t last_error = g_last_error;
+        g_last_error = E_NONE;
+        memset(g_cache_errors, 0, sizeof(g_cache_errors));
+        disasm_word(d, w, size, mode);
+
+        e->w = w, e->mode = mode, e->d = *d, e->error = g_last_error;
+        memcpy(e->errors, g_cache_errors, sizeof(e->errors));
+        if(g_last_error == E_NONE) {
+            g_last_error = last_error;
+        }
+    }
+    return idx;
+}
+
+#ifdef DARM_STATS
+
+static darm_stats_t g_stats;
+
+uint64_t darm_stats_clock(void)
+{
+#if defined(__x86_64__) || defined(__i386__)
+    return __builtin_ia32_rdtsc();
+#else
+    return clock();
+#endif
+}
+
+void darm_stats_record(const darm_t *d, int ret, uint64_t cycles)
+{
+    uint32_t instr = ret < 0 ? I_INVLD : d->instr;
+    uint32_t instr_type = d->instr_type;
+
+    if(instr >= ARRAYSIZE(g_stats.instr_count)) instr = I_INVLD;
+    if(instr_type >= ARRAYSIZE(g_stats.enctype_count)) instr_type = T_INVLD;
+
+    __atomic_fetch_add(&g_stats.enctype_count[instr_type], 1,
+        __ATOMIC_RELAXED);
+    __atomic_fetch_add(&g_stats.enctype_cycles[instr_type], cycles,
+        __ATOMIC_RELAXED);
+    __atomic_fetch_add(&g_stats.instr_count[instr], 1, __ATOMIC_RELAXED);
+}
+
+int darm_stats(darm_stats_t *stats)
+{
+    uint64_t *dst = (uint64_t *) stats, *src = (uint64_t *) &g_stats;
+    for (size_t idx = 0; idx < sizeof(g_stats) / sizeof(uint64_t); idx++) {
+        dst[idx] = __atomic_load_n(&src[idx], __ATOMIC_RELAXED);
+    }
+    return 0;
+}
+
+void darm_stats_reset(void)
+{
+    uint64_t *p = (uint64_t *) &g_stats;
+    for (size_t idx = 0; idx < sizeof(g_stats) / sizeof(uint64_t); idx++) {
+        __atomic_store_n(&p[idx], 0, __ATOMIC_RELAXED);
+    }
+}
+
+#else
+
+int darm_stats(darm_stats_t *stats)
+{
+    (void) stats;
+    return -1;
+}
+
+void darm_stats_reset(void)
+{
+}
+
+#endif
+
+int darm_error(darm_error_t err)
+{
+    g_last_error = err;
+    if(g_cache_errors[err] != 255) {
+        g_cache_errors[err]++;
+    }
+    __atomic_fetch_add(&g_errors[err], 1, __ATOMIC_RELAXED);
+    return !__atomic_load_n(&g_quiet, __ATOMIC_RELAXED);
+}
+
+void darm_set_quiet(int quiet)
+{
+    __atomic_store_n(&g_quiet, quiet != 0, __ATOMIC_RELAXED);
+}
+
+darm_error_t darm_last_error(void)
+{
+    return g_last_error;
+}
+
+uint64_t darm_error_count(darm_error_t err)
+{
+    return err < E_ERRCNT ?
+        __atomic_load_n(&g_errors[err], __ATOMIC_RELAXED) : 0;
+}
+
+void darm_errors_reset(void)
+{
+    for (uint32_t idx = 0; idx < E_ERRCNT; idx++) {
+        __atomic_store_n(&g_errors[idx], 0, __ATOMIC_RELAXED);
+    }
+}
+
+size_t darm_format_buffer(char *out, size_t *outlen, const uint8_t *buf,
+    size_t len, darm_mode_t mode, uint32_t address, int lowercase)
+{
+    size_t off = 0, written = 0;
+    darm_t d; darm_str_t str;
+
+    if(mode != M_ARM && mode != M_THUMB) {
+        *outlen = 0;
+        return 0;
+    }
+
+    // each line takes at most 85 bytes, snprintf() also writes a null-byte
+    while (*outlen - written >= 96) {
+        const char *text = "(invalid)";
+        uint32_t w, size = read_word(&w, buf + off, len - off, mode);
+        if(size == 0) break;
+
+        disasm_word(&d, w, size, mode);
+
+        if(d.instr != I_INVLD && darm_str2(&d, &str, lowercase) == 0) {
+            text = str.instr;
+        }
+
+        written += snprintf(out + written, *outlen - written,
+            lowercase != 0 ? "%08x:\t%0*x\t%s\n" : "%08X:\t%0*X\t%s\n",
+            address + (uint32_t) off, size * 2, w, text);
+        off += size;
+    }
+
+    *outlen = written;
+    return off;
+}
+
 // darm internal functions
-int extract_insn_bits(darm_fieldgrab_t* t, uint32_t def, uint32_t w){
+int extract_insn_bits(const darm_fieldgrab_t* t, uint32_t def, uint32_t w){
     int ret = def;
     if (F_SHIFT_MASK == t->type){
         ret = GETBT(w, t->shift, t->mask);
@@ -702,26 +1329,25 @@ int extract_insn_bits(darm_fieldgrab_t* t, uint32_t def, uint32_t w){
     return ret;
 }
 
-const char* extract_string_const(darm_fieldgrab_t* t, char* def){
+const char* extract_string_const(const darm_fieldgrab_t* t, char* def){
     const char* ret = def;
     if (F_STRING_CONST == t->type){
-        ret = t->str;
+        ret = darm_string(t->str);
     }
     return ret;
 }
 
-int extract_imm(darm_fieldgrab_t* t, uint32_t w){
+int extract_imm(const darm_fieldgrab_t* t, uint32_t w){
     int imm;
     if (F_IMMEDIATE != t->type){
         return 0;
     }
-    t->type = F_SHIFT_MASK;
-    imm = extract_insn_bits(t, 0, w);
-    t->type = F_IMMEDIATE;
+    // the tables are shared between threads, so don't touch t->type here
+    imm = GETBT(w, t->shift, t->mask);
     if (t->extend == 1){
         imm = sign_ext32(imm, t->mask);
     }
-    if (t->mult > 0){
+    if (t->mult != 0){
         imm *= t->mult;
     }
     return imm;
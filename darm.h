@@ -30,6 +30,8 @@ POSSIBILITY OF SUCH DAMAGE.
 #ifndef __DARM__
 #define __DARM__
 
+#include <stddef.h>
+
 #include "armv7-tbl.h"
 #include "thumb-tbl.h"
 #include "ext-tbl.h"
@@ -97,6 +99,31 @@ typedef enum _darm_mode_t {
     M_INVLD = -1,
 } darm_mode_t;
 
+// reason of a failure to decode or to render an instruction
+typedef enum _darm_error_t {
+    // no failure
+    E_NONE,
+
+    // the lookup tables have no entry for the encoding
+    E_LOOKUP,
+
+    // the decoder doesn't handle the encoding (yet), or it's undefined
+    E_UNHANDLED,
+
+    // one of the fields of the encoding holds an unsupported value
+    E_OPERAND,
+
+    // darm_str() or darm_operands() was given an invalid instruction or
+    // mode
+    E_INSTR,
+
+    // darm_str() or darm_operands() found no (valid) format string for the
+    // instruction
+    E_FORMAT,
+
+    E_ERRCNT
+} darm_error_t;
+
 typedef struct _darm_t {
     // the original encoded instruction
     uint32_t        w;
@@ -219,6 +246,122 @@ typedef struct _darm_str_t {
     char instr[64];
 } darm_str_t;
 
+typedef enum _darm_operand_type_t {
+    OP_INVLD,
+
+    // a register, reg
+    OP_REG,
+
+    // an immediate, imm
+    OP_IMM,
+
+    // a memory address, its base register reg and either the offset
+    // register index, possibly shifted, or the offset imm
+    OP_MEM,
+
+    // the shift of the preceding register operand, or the rotation of
+    // the extend instructions as ROR
+    OP_SHIFT,
+
+    // a list of registers, either the reglist bitmask of core registers or
+    // count consecutive registers starting at reg
+    OP_REGLIST,
+} darm_operand_type_t;
+
+// the operands as rendered by darm_str() take at most its four arguments
+// and the shift
+#define DARM_MAX_OPERANDS 5
+
+typedef struct _darm_operand_t {
+    darm_operand_type_t type;
+
+    // the register, the base register of a memory address, or the first of
+    // a list of consecutive registers
+    darm_reg_t      reg;
+
+    // the offset register of a memory address
+    darm_reg_t      index;
+
+    // the immediate, or the offset of a memory address
+    uint32_t        imm;
+
+    // whether the index or immediate offset is subtracted rather than
+    // added, or the post-indexed register or immediate is
+    uint32_t        subtract;
+
+    // the shift, or the shift of the offset register of a memory address,
+    // with the amount decoded as by darm_immshift_decode(), e.g., 32 for
+    // an LSR with the amount encoded as 0, and RRX being a ROR by 0
+    darm_shift_type_t shift_type;
+    darm_reg_t      Rs;
+    uint32_t        shift;
+
+    // the registers of a list of registers
+    uint16_t        reglist;
+    uint16_t        count;
+
+    // whether the register or memory address is written back, which
+    // includes every post-indexed memory address
+    uint32_t        writeback;
+} darm_operand_t;
+
+typedef struct _darm_cache_entry_t {
+    // the encoded instruction and the mode it was decoded in, mode is -1
+    // for unused entries
+    uint32_t        w;
+    int32_t         mode;
+
+    // the last failure reported while decoding the instruction, if any,
+    // and the amount of failures of each reason (up to 255), which are
+    // reported again on every hit
+    darm_error_t    error;
+    uint8_t         errors[E_ERRCNT];
+
+    darm_t          d;
+} darm_cache_entry_t;
+
+// direct-mapped cache of decoded instructions, an entry is evicted when a
+// different instruction maps onto the same slot
+typedef struct _darm_cache_t {
+    darm_cache_entry_t *entries;
+
+    // amount of entries, has to be a power of two
+    uint32_t        count;
+
+    uint64_t        hits;
+    uint64_t        misses;
+    uint64_t        evictions;
+} darm_cache_t;
+
+// counters of what the decoders have seen, which are only maintained by a
+// build of libdarm with DARM_STATS defined (make STATS=1), as maintaining
+// them slows down decoding considerably
+typedef struct _darm_stats_t {
+    // amount of instructions decoded per encoding class, including the ones
+    // that failed to decode, and the cycles (or clock() ticks, on other than
+    // x86) spent on them
+    uint64_t        enctype_count[ARRAYSIZE(darm_enctypes)];
+    uint64_t        enctype_cycles[ARRAYSIZE(darm_enctypes)];
+
+    // amount of successfully decoded instructions per instruction, failures
+    // are accounted for as I_INVLD
+    uint64_t        instr_count[I_INSTRCNT];
+} darm_stats_t;
+
+// the sizes of darm_t, darm_str_t, darm_cache_entry_t, darm_cache_t and
+// darm_stats_t, each followed by the offset and size of its members, which
+// the python bindings (darm_ctypes.py, as generated by darmgen.py from this
+// file) check their own structures against
+extern const uint32_t darm_layout[];
+extern const uint32_t darm_layout_count;
+
+// all of the functions below are reentrant; they keep no state between
+// calls and only read from the instruction tables, so they may be called
+// concurrently from multiple threads, as long as each thread passes its own
+// darm_t and darm_str_t objects (the counters of a DARM_STATS build and the
+// failure counters are updated atomically, the last failure is kept per
+// thread)
+
 // disassemble an armv7 instruction
 int darm_armv7_disasm(darm_t *d, uint32_t w);
 
@@ -228,12 +371,70 @@ int darm_thumb_disasm(darm_t *d, uint16_t w);
 // disassemble a thumb2 instruction
 int darm_thumb2_disasm(darm_t *d, uint16_t w, uint16_t w2);
 
+// disassemble a little-endian encoded thumb or thumb2 instruction, whether
+// it is 16-bit or 32-bit wide is detected from the first halfword, returns
+// the length of the instruction in bytes, or zero if the buffer is too short
+// to contain the instruction, instructions which could not be decoded have
+// their instr member set to I_INVLD
+uint32_t darm_thumb2_disasm_bytes(darm_t *d, const uint8_t *buf, size_t len);
+
+// disassemble a buffer of little-endian encoded instructions, where mode is
+// either M_ARM or M_THUMB (which includes thumb2), each instruction is
+// written to the next darm_t object in d, returns the amount of darm_t
+// objects that have been filled, instructions which could not be decoded
+// have their instr member set to I_INVLD
+size_t darm_disasm_buffer(darm_t *d, size_t count, const uint8_t *buf,
+    size_t len, darm_mode_t mode);
+
+// the amount of darm_t objects that darm_disasm_buffer fills for a buffer,
+// which only looks at the size of every instruction, so it's much faster,
+// end (if not NULL) is set to the offset following the last instruction
+size_t darm_buffer_count(const uint8_t *buf, size_t len, darm_mode_t mode,
+    size_t *end);
+
+// initialize a cache with count entries, count has to be a nonzero power of
+// two, otherwise -1 is returned and the cache is initialized as an empty
+// cache, which instructions are always decoded without
+int darm_cache_init(darm_cache_t *cache, darm_cache_entry_t *entries,
+    uint32_t count);
+
+// same as darm_disasm_buffer, but instructions found in the cache are copied
+// from it rather than decoded, cache may be NULL, and as the cache is
+// updated it should not be shared between threads; hits are counted by the
+// failure counters and by the counters of a DARM_STATS build as if they
+// were decoded again
+size_t darm_disasm_buffer_cached(darm_t *d, size_t count, const uint8_t *buf,
+    size_t len, darm_mode_t mode, darm_cache_t *cache);
+
+// copy the counters of a DARM_STATS build into stats, returns -1 if libdarm
+// has been built without DARM_STATS
+int darm_stats(darm_stats_t *stats);
+
+// reset the counters of a DARM_STATS build
+void darm_stats_reset(void);
+
+// failures are reported on stderr, unless quiet mode is enabled, in which
+// case they're only reported through the return values, darm_last_error()
+// and darm_error_count(), which is much faster when sweeping over data
+void darm_set_quiet(int quiet);
+
+// the reason of the last failure of the calling thread, E_NONE if there was
+// none yet
+darm_error_t darm_last_error(void);
+
+// amount of failures for the given reason, over all threads
+uint64_t darm_error_count(darm_error_t err);
+
+// reset the failure counters
+void darm_errors_reset(void);
+
 int darm_immshift_decode(const darm_t *d, const char **type,
     uint32_t *immediate);
 
 const char *darm_datatype_name(darm_datatype_t dtype);
 const char *darm_mnemonic_name(darm_instr_t instr);
 const char *darm_enctype_name(darm_enctype_t enctype);
+const char *darm_error_name(darm_error_t err);
 const char *darm_any_register_name(darm_reg_t reg, darm_datatype_t dtype);
 const char *darm_register_name(darm_reg_t reg);
 const char *darm_shift_type_name(darm_shift_type_t shifttype);
@@ -256,6 +457,18 @@ void darm_dump(const darm_t *d);
 int darm_str(const darm_t *d, darm_str_t *str);
 int darm_str2(const darm_t *d, darm_str_t *str, int lowercase);
 
+// the operands of an instruction, in the order in which darm_str() renders
+// them, without rendering them, returns the amount of operands stored in
+// ops, which has room for DARM_MAX_OPERANDS, or -1 if darm_str() fails
+int darm_operands(const darm_t *d, darm_operand_t *ops);
+
+// render a listing of the instructions in a buffer, see darm_disasm_buffer,
+// into out, with one line containing the address, encoding and text for
+// each instruction, outlen is the size of out and receives the length of
+// the listing, returns the amount of bytes of buf that have been rendered
+size_t darm_format_buffer(char *out, size_t *outlen, const uint8_t *buf,
+    size_t len, darm_mode_t mode, uint32_t address, int lowercase);
+
 
 int32_t sign_ext32(int32_t v, uint32_t len);
 
@@ -281,11 +494,42 @@ int32_t sign_ext32(int32_t v, uint32_t len);
 // thumb/thumb2 helpers
 #define IS_THUMB2_32BIT(__sw) ((GETBT(__sw, 13, 3) == 0b111) && (GETBT(__sw, 11, 2) != 0b00))
 #define THUMB_LOOKUP_INDEX(__v) (GETBT(__v, 6, 10))
-#define THUMB_INSTR_LOOKUP(__v) (thumb_instr_lookup[THUMB_LOOKUP_INDEX(__v)])
 #define THUMB2_16_LOOKUP_INDEX(__v) (GETBT(__v, 5, 7))
-#define THUMB2_16_INSTR_LOOKUP(__v) (thumb2_16_instr_lookup[THUMB2_16_LOOKUP_INDEX(__v)])
 #define THUMB2_LOOKUP_INDEX(__v) (((GETBT(__v, 27, 2) << 13) | (GETBT(__v, 23, 3) << 10 ) | (GETBT(__v, 20, 1) << 9) | (GETBT(__v, 8, 8) << 1) | (GETBT(__v, 4, 1))))
+
+// when building with DARM_LOOKUP_TREE defined (make LOOKUP=tree), the
+// lookup tables are replaced by decision trees, which darmgen.py generates
+// from the same tables, and which only hold the distinct entries, with
+// DARM_LOOKUP_PAGED defined (make LOOKUP=paged) they are replaced by
+// two-level tables of indices of the distinct entries, of which identical
+// blocks are only emitted once
+static inline uint32_t darm_tree_lookup(const darm_tree_node_t *tree,
+    uint32_t idx)
+{
+    uint32_t node = 0;
+    do {
+        node = tree[node].next[(idx >> tree[node].bit) & 1];
+    } while ((node & DARM_TREE_LEAF) == 0);
+    return node & ~DARM_TREE_LEAF;
+}
+
+#define DARM_PAGED_LOOKUP(name, idx) (name##_leaves[ \
+    name##_blocks[name##_pages[(idx) / ARRAYSIZE(name##_blocks[0])]] \
+        [(idx) % ARRAYSIZE(name##_blocks[0])]])
+
+#if defined(DARM_LOOKUP_TREE)
+#define THUMB_INSTR_LOOKUP(__v) (thumb_instr_leaves[darm_tree_lookup(thumb_instr_tree, THUMB_LOOKUP_INDEX(__v))])
+#define THUMB2_16_INSTR_LOOKUP(__v) (thumb2_16_instr_leaves[darm_tree_lookup(thumb2_16_instr_tree, THUMB2_16_LOOKUP_INDEX(__v))])
+#define THUMB2_INSTR_LOOKUP(__v) (thumb2_instr_leaves[darm_tree_lookup(thumb2_instr_tree, THUMB2_LOOKUP_INDEX(__v))])
+#elif defined(DARM_LOOKUP_PAGED)
+#define THUMB_INSTR_LOOKUP(__v) DARM_PAGED_LOOKUP(thumb_instr, THUMB_LOOKUP_INDEX(__v))
+#define THUMB2_16_INSTR_LOOKUP(__v) DARM_PAGED_LOOKUP(thumb2_16_instr, THUMB2_16_LOOKUP_INDEX(__v))
+#define THUMB2_INSTR_LOOKUP(__v) DARM_PAGED_LOOKUP(thumb2_instr, THUMB2_LOOKUP_INDEX(__v))
+#else
+#define THUMB_INSTR_LOOKUP(__v) (thumb_instr_lookup[THUMB_LOOKUP_INDEX(__v)])
+#define THUMB2_16_INSTR_LOOKUP(__v) (thumb2_16_instr_lookup[THUMB2_16_LOOKUP_INDEX(__v)])
 #define THUMB2_INSTR_LOOKUP(__v) (thumb2_instr_lookup[THUMB2_LOOKUP_INDEX(__v)])
+#endif
 
 //#define THUMB2_INSTR_LOOKUP(__v) (thumb2_instr_lookup[(GETBT(__v, 20, 9) << 1) | GETBT(__v, 16, 1)])
 
@@ -316,9 +560,88 @@ int32_t sign_ext32(int32_t v, uint32_t len);
 #define IS_SIMD(__sw) (IS_ARM_SIMD(__sw) || IS_THUMB_SIMD(__sw))
 #define IS_VFP(__sw) (IS_ARM_VFP(__sw) || IS_THUMB_VFP(__sw))
 
-int extract_insn_bits(darm_fieldgrab_t* t, uint32_t def, uint32_t w);
-const char* extract_string_const(darm_fieldgrab_t* t, char* def);
-int extract_imm(darm_fieldgrab_t* t, uint32_t w);
+// the generated string tables hold offsets in darm_strings, offset 0 being
+// a null pointer
+static inline const char *darm_string(uint16_t offset)
+{
+    return offset != 0 ? darm_strings + offset : NULL;
+}
+
+int extract_insn_bits(const darm_fieldgrab_t* t, uint32_t def, uint32_t w);
+const char* extract_string_const(const darm_fieldgrab_t* t, char* def);
+int extract_imm(const darm_fieldgrab_t* t, uint32_t w);
+
+#ifdef DARM_STATS
+uint64_t darm_stats_clock(void);
+void darm_stats_record(const darm_t *d, int ret, uint64_t cycles);
+#endif
+
+// records a failure, evaluates to whether it should be reported on stderr,
+// for use through DARM_ERROR(), which only formats the message if so
+int darm_error(darm_error_t err);
+#define DARM_ERROR(__err, ...) \
+    (darm_error(__err) ? fprintf(stderr, __VA_ARGS__) : 0)
+
+// every member of a darm_t that hasn't been decoded (yet), which the decoders
+// start out with by copying it as a whole
+extern const darm_t darm_invalid;
+
+static inline void darm_init(darm_t *d)
+{
+    *d = darm_invalid;
+}
+
+// same as darm_thumb_disasm(), but without being accounted for in the
+// counters, for use by darm_thumb2_disasm()
+int darm_thumb_decode(darm_t *d, uint16_t w);
+
+// when building with DARM_THUMB_TABLE defined as one of the following, 16-bit
+// thumb instructions are decoded and rendered through thumb-full-tbl.c, which
+// darmgen.py generates from a build of libdarm without DARM_THUMB_TABLE
+#define DARM_THUMB_TABLE_COMPACT 1
+#define DARM_THUMB_TABLE_FULL 2
+
+typedef struct _darm_thumb_packed_t {
+    uint16_t        instr;
+    uint8_t         instr_type;
+
+    // 0 if the instruction was rejected upfront, 1 if there was no lookup
+    // entry for it, 2 if it has been (partially) decoded
+    uint8_t         stage;
+
+    // return value of darm_thumb_disasm()
+    int8_t          ret;
+
+    int8_t          cond;
+    int8_t          Rd;
+    int8_t          Rn;
+    int8_t          Rm;
+    int8_t          Rt;
+
+    // the S, I, P and W flags, two bits each
+    uint8_t         flags;
+
+    // the darm_error_t reported by darm_thumb_disasm(), if any
+    uint8_t         error;
+
+    uint16_t        reglist;
+    int16_t         imm;
+} darm_thumb_packed_t;
+
+typedef struct _darm_thumb_full_t {
+    darm_t          d;
+
+    // return value of darm_thumb_disasm()
+    int32_t         ret;
+
+    // the darm_error_t reported by darm_thumb_disasm(), if any
+    int32_t         error;
+} darm_thumb_full_t;
+
+// copy the pre-rendered strings of a 16-bit thumb instruction (only with
+// DARM_THUMB_TABLE_FULL), returns -1 if there are none, or if d differs from
+// what darm_thumb_disasm() returns
+int darm_thumb_str(const darm_t *d, darm_str_t *str);
 
 // These macros are generated by darmgen.py
 
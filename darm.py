@@ -26,13 +26,76 @@ CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
 ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 POSSIBILITY OF SUCH DAMAGE.
 """
-from ctypes import cdll, Structure, byref, POINTER, create_string_buffer
+from ctypes import cdll, byref, POINTER, create_string_buffer
 from ctypes import c_uint16, c_int32, c_uint32, c_char_p, c_char
+from ctypes import c_size_t, c_void_p, addressof, cast, string_at
+from ctypes import c_uint64, sizeof
+import bisect
+import collections
+import itertools
+import mmap
+import os
+import struct
+import threading
+import weakref
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-class _Base:
-    def __init__(self, idx):
-        self.idx = idx
+# the structures of darm.h, as generated by darmgen.py
+from darm_ctypes import _Darm, _DarmStr, _DarmOperand, _DarmCacheEntry
+from darm_ctypes import _DarmCache, _DarmStats, check as _check_layout, dtypes
+
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+def _str(s):
+    """Converts a string returned by libdarm into a native string."""
+    return s if s is None or isinstance(s, str) else s.decode('ascii')
+
+
+class _Base(object):
+    """Immutable object representing an entry in one of darm's tables.
+
+    Instances are interned, every index is represented by exactly one object
+    whose name has been looked up once, when the table was created.
+
+    """
+    __slots__ = 'idx', 'name'
+
+    def __new__(cls, idx):
+        obj = cls._interned.get(idx)
+        return obj if obj is not None else cls._create(idx)
+
+    @classmethod
+    def _create(cls, idx):
+        obj = object.__new__(cls)
+        object.__setattr__(obj, 'idx', idx)
+        object.__setattr__(obj, 'name', _str(cls._lookup(idx)))
+        return obj
+
+    @classmethod
+    def _intern(cls, indices):
+        for idx in indices:
+            cls._interned[idx] = cls._create(idx)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('%s objects are immutable' %
+                             self.__class__.__name__)
+
+    def __reduce__(self):
+        return self.__class__, (self.idx,)
 
     def __int__(self):
         return self.idx
@@ -42,45 +105,60 @@ class _Base:
 
     __bool__ = __nonzero__
 
+    def __str__(self):
+        return self.name
+
 
 class Condition(_Base):
+    __slots__ = ()
     _nonzero = -1
+    _interned = {}
 
-    def __str__(self):
-        return _lib.darm_condition_name(self.idx, 0)
+    @staticmethod
+    def _lookup(idx):
+        return _lib.darm_condition_name(idx, 0)
 
     def __repr__(self):
-        return 'C_%s' % self.__str__()
+        return 'C_%s' % self.name
 
 
 class Instruction(_Base):
+    __slots__ = ()
     _nonzero = 0
+    _interned = {}
 
-    def __str__(self):
-        return _lib.darm_mnemonic_name(self.idx)
+    @staticmethod
+    def _lookup(idx):
+        return _lib.darm_mnemonic_name(idx)
 
     def __repr__(self):
-        return 'I_%s' % self.__str__()
+        return 'I_%s' % self.name
 
 
 class Register(_Base):
+    __slots__ = ()
     _nonzero = -1
+    _interned = {}
 
-    def __str__(self):
-        return _lib.darm_register_name(self.idx)
+    @staticmethod
+    def _lookup(idx):
+        return _lib.darm_register_name(idx)
 
     def __repr__(self):
-        return self.__str__()
+        return self.name
 
 
 class Encoding(_Base):
+    __slots__ = ()
     _nonzero = 0
+    _interned = {}
 
-    def __str__(self):
-        return _lib.darm_enctype_name(self.idx)
+    @staticmethod
+    def _lookup(idx):
+        return _lib.darm_enctype_name(idx)
 
     def __repr__(self):
-        return 'T_%s' % self.__str__()
+        return 'T_%s' % self.name
 
 
 class Shift:
@@ -90,7 +168,7 @@ class Shift:
         self.shift = shift
 
     def type_name(self):
-        return _lib.darm_shift_type_name(self.type_)
+        return _shift_type_names.get(self.type_)
 
     def __str__(self):
         type_name = self.type_name()
@@ -109,6 +187,8 @@ class Shift:
     def __nonzero__(self):
         return self.type_ != -1
 
+    __bool__ = __nonzero__
+
 
 class RegisterList:
     def __init__(self, reglist):
@@ -117,11 +197,69 @@ class RegisterList:
     def __str__(self):
         buf = create_string_buffer(64)
         _lib.darm_reglist(self.reglist, buf)
-        return buf.value
+        return _str(buf.value)
 
     def __nonzero__(self):
         return self.reglist != 0
 
+    __bool__ = __nonzero__
+
+
+# the operands of Darm.operands, see darm_operands() in darm.h; subtracted
+# immediates are negative, offset is None, an immediate or a Reg, and shift
+# is None or the Shift of the offset register
+Reg = collections.namedtuple('Reg', 'reg subtract writeback')
+Imm = collections.namedtuple('Imm', 'imm')
+Mem = collections.namedtuple('Mem', 'base offset shift writeback')
+RegList = collections.namedtuple('RegList', 'registers')
+
+# the types of darm_operand_t
+_OP_REG, _OP_IMM, _OP_MEM, _OP_SHIFT, _OP_REGLIST = range(1, 6)
+
+_DARM_MAX_OPERANDS = 5
+
+_Operands = _DarmOperand * _DARM_MAX_OPERANDS
+
+# the members of darm_operand_t, which are unpacked at once, rather than
+# going through ctypes for each of them
+_operand_format = ''.join(t._type_ for _, t in _DarmOperand._fields_)
+_operand_members = len(_DarmOperand._fields_)
+
+# the RegList of each register bitmask that has been seen so far
+_reglists = {}
+
+
+def _shift(shift_type, Rs, shift):
+    return Shift(shift_type, Register(Rs) if Rs >= 0 else None, shift)
+
+
+def _operand(type_, reg, index, imm, subtract, shift_type, Rs, shift,
+             reglist, count, writeback):
+    """Converts the members of a darm_operand_t into an operand tuple."""
+    if type_ == _OP_REG:
+        return Reg(Register(reg), subtract != 0, writeback != 0)
+    if subtract:
+        imm = -imm
+    if type_ == _OP_IMM:
+        return Imm(imm)
+    if type_ == _OP_MEM:
+        if index >= 0:
+            offset = Reg(Register(index), subtract != 0, False)
+        else:
+            offset = imm if imm else None
+        return Mem(Register(reg), offset,
+                   _shift(shift_type, Rs, shift) if shift_type >= 0 else None,
+                   writeback != 0)
+    if type_ == _OP_SHIFT:
+        return _shift(shift_type, Rs, shift)
+    if reglist:
+        ret = _reglists.get(reglist)
+        if ret is None:
+            ret = _reglists[reglist] = RegList(tuple(
+                Register(idx) for idx in range(16) if reglist & (1 << idx)))
+        return ret
+    return RegList(tuple([Register(reg + idx) for idx in range(count)]))
+
 
 def flag(v):
     """Boolean flag.
@@ -129,86 +267,73 @@ def flag(v):
     http://thedailywtf.com/Articles/What_Is_Truth_0x3f_.aspx
 
     """
-    return {0: False, 1: True, 2: None}[v]
-
-
-class _Darm(Structure):
-    _fields_ = [
-        ('w', c_uint32),
-        ('instr', c_uint32),
-        ('instr_type', c_uint32),
-        ('cond', c_uint32),
-        ('B', c_uint32),
-        ('S', c_uint32),
-        ('E', c_uint32),
-        ('M', c_uint32),
-        ('N', c_uint32),
-        ('option', c_int32),
-        ('U', c_uint32),
-        ('H', c_uint32),
-        ('P', c_uint32),
-        ('R', c_uint32),
-        ('T', c_uint32),
-        ('W', c_uint32),
-        ('I', c_uint32),
-        ('rotate', c_uint32),
-        ('Rd', c_int32),
-        ('Rn', c_int32),
-        ('Rm', c_int32),
-        ('Ra', c_int32),
-        ('Rt', c_int32),
-        ('Rt2', c_int32),
-        ('RdHi', c_int32),
-        ('RdLo', c_int32),
-        ('imm', c_uint32),
-        ('type_', c_int32),
-        ('Rs', c_int32),
-        ('shift', c_uint32),
-        ('lsb', c_uint32),
-        ('width', c_uint32),
-        ('reglist', c_uint16),
-    ]
-
-
-class _DarmStr(Structure):
-    _fields_ = [
-        ('mnemonic', c_char * 12),
-        ('arg0', c_char * 32),
-        ('arg1', c_char * 32),
-        ('arg2', c_char * 32),
-        ('arg3', c_char * 32),
-        ('shift', c_char * 12),
-        ('instr', c_char * 64),
-    ]
-
-
-class Darm:
+    return _flag_values[v]
+
+_flag_values = {0: False, 1: True, 2: None}
+
+
+class Darm(object):
+    """Disassembled instruction.
+
+    Every member is read from the underlying _Darm structure on demand, so
+    that scanning through large amounts of instructions only pays for the
+    members that are actually being looked at.
+
+    """
+    __slots__ = 'd', 's'
+
     _flags = 'B', 'S', 'E', 'M', 'N', 'U', 'H', 'P', 'R', 'T', 'W', 'I'
     _regs = 'Rd', 'Rn', 'Rm', 'Ra', 'Rt', 'Rt2', 'RdHi', 'RdLo'
 
     def __init__(self, d):
         self.d = d
-        self.w = d.w
-        self.instr = Instruction(d.instr)
-        self.instr_type = Encoding(d.instr_type)
-        self.cond = Condition(d.cond)
-
-        for x in self._flags:
-            setattr(self, x, flag(getattr(d, x)))
-
-        for x in self._regs:
-            r = getattr(d, x)
-            setattr(self, x, Register(r) if r >= 0 else None)
-
-        self.rotate = d.rotate
-        self.option = d.option
-        self.imm = d.imm
-        self.shift = Shift(d.type_,
-                           Register(d.Rs) if d.Rs >= 0 else None,
-                           d.shift)
-        self.lsb = d.lsb
-        self.width = d.width
-        self.reglist = RegisterList(d.reglist)
+        self.s = None
+
+    @property
+    def w(self):
+        return self.d.w
+
+    @property
+    def instr(self):
+        return Instruction(self.d.instr)
+
+    @property
+    def instr_type(self):
+        return Encoding(self.d.instr_type)
+
+    @property
+    def cond(self):
+        return Condition(self.d.cond)
+
+    @property
+    def rotate(self):
+        return self.d.rotate
+
+    @property
+    def option(self):
+        return self.d.option
+
+    @property
+    def imm(self):
+        return self.d.imm
+
+    @property
+    def shift(self):
+        d = self.d
+        return Shift(d.shift_type, Register(d.Rs) if d.Rs >= 0 else None,
+                     d.shift)
+
+    @property
+    def lsb(self):
+        return self.d.lsb
+
+    @property
+    def width(self):
+        return self.d.width
+
+    @property
+    def reglist(self):
+        return RegisterList(self.d.reglist)
 
     def __repr__(self):
         g = lambda x: getattr(self, x)
@@ -246,34 +371,742 @@ class Darm:
         return 'Darm(instr=%s, instr_type=%s, cond=%s%s)' % \
             (repr(self.instr), repr(self.instr_type), repr(self.cond), args)
 
+    @property
+    def operands(self):
+        """The operands in the order in which str() renders them, as Reg,
+        Imm, Mem, Shift and RegList tuples, without rendering them."""
+        ops = _Operands()
+        count = _lib.darm_operands(self.d, ops)
+        if count <= 0:
+            return ()
+
+        values = struct.unpack_from(_operand_format * count, ops)
+        if count == 1:
+            return _operand(*values),
+        return tuple([_operand(*values[idx:idx + _operand_members])
+                      for idx in range(0, len(values), _operand_members)])
+
     def __str__(self):
-        x = _DarmStr()
-        if _lib.darm_str2(self.d, byref(x), True) == 0:
-            return x.instr
-        return ''
+        if self.s is None:
+            x = _DarmStr()
+            if _lib.darm_str2(self.d, byref(x), True) == 0:
+                self.s = _str(x.instr)
+            else:
+                self.s = ''
+        return self.s
 
 
-def disasm(w):
+def _flag_property(name):
+    return property(lambda self: _flag_values[getattr(self.d, name)])
+
+
+def _register_property(name):
+    def get(self):
+        r = getattr(self.d, name)
+        return Register(r) if r >= 0 else None
+    return property(get)
+
+for _name in Darm._flags:
+    setattr(Darm, _name, _flag_property(_name))
+
+for _name in Darm._regs:
+    setattr(Darm, _name, _register_property(_name))
+
+
+def _disasm(w):
     d = _Darm()
     ret = _lib.darm_armv7_disasm(byref(d), w)
     return Darm(d) if ret == 0 else None
 
+
+def _disasm_thumb(w):
+    d = _Darm()
+    ret = _lib.darm_thumb_disasm(byref(d), w)
+    return Darm(d) if ret == 0 else None
+
+
+def _disasm_thumb2(w, w2=0):
+    d = _Darm()
+    ret = _lib.darm_thumb2_disasm(byref(d), w, w2)
+    return Darm(d) if ret == 0 else None
+
+
+class Cache(object):
+    """Bounded LRU cache of decoded instructions, keyed by (mode, word).
+
+    Decoding a word that is in the cache through disasm(), disasm_thumb()
+    or disasm_thumb2() returns the very same Darm object, including its
+    memoized string representation. The batch functions instead use a
+    native direct-mapped cache of (at least) the same size in every thread,
+    from which repeated words are copied rather than decoded.
+
+    """
+    def __init__(self, size=0x1000):
+        if size <= 0:
+            raise ValueError('invalid cache size %r' % size)
+
+        self.size = size
+        self.hits = self.misses = self.evictions = 0
+        self._entries = collections.OrderedDict()
+
+        # the native caches are direct-mapped, so their size is a power of
+        # two, and as they are updated while the GIL is released, each
+        # thread gets its own
+        self._count = 1
+        while self._count < size:
+            self._count *= 2
+
+        self._local = threading.local()
+        self._natives = []
+
+    def get(self, key, decode, *args):
+        """Returns the cached value for key, or caches decode(*args)."""
+        entries = self._entries
+        value = entries.pop(key, _missing)
+        if value is _missing:
+            value = decode(*args)
+            self.misses += 1
+            if len(entries) >= self.size:
+                entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+        entries[key] = value
+        return value
+
+    def native(self):
+        """Returns the native cache of the current thread."""
+        cache = getattr(self._local, 'cache', None)
+        if cache is None:
+            cache = self._local.cache = _DarmCache()
+            cache.array = (_DarmCacheEntry * self._count)()
+            if _lib.darm_cache_init(byref(cache), cache.array,
+                                    self._count) < 0:
+                raise ValueError('invalid cache size %r' % self.size)
+            self._natives.append(cache)
+        return cache
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+        for cache in self._natives:
+            _lib.darm_cache_init(byref(cache), cache.array, self._count)
+
+    def info(self):
+        """Returns the hit, miss and eviction counters of the caches."""
+        ret = dict(size=self.size, length=len(self._entries), hits=self.hits,
+                   misses=self.misses, evictions=self.evictions)
+        for name in ('hits', 'misses', 'evictions'):
+            ret['native_' + name] = sum(getattr(cache, name)
+                                        for cache in self._natives)
+        return ret
+
+    def __len__(self):
+        return len(self._entries)
+
+_cache = None
+
+# marks keys that are not in the cache, as None is a valid decoding
+_missing = object()
+
+
+def set_cache(size=0x1000):
+    """Enables caching of decoded instructions, or disables it if size is
+    zero or None. Returns the new Cache object, if any."""
+    global _cache
+    _cache = Cache(size) if size else None
+    return _cache
+
+
+def cache_info():
+    """Returns the counters of the current cache, see Cache.info()."""
+    return _cache.info() if _cache is not None else None
+
+
+def stats():
+    """Returns the counters of a libdarm built with DARM_STATS (make STATS=1)
+    as a dictionary with an 'encodings' dictionary, mapping every Encoding
+    seen by the decoders to a (count, cycles) tuple, and an 'instructions'
+    dictionary, mapping every Instruction to its count. Failures are counted
+    as the Encoding they failed in and as Instruction 0 (I_INVLD).
+
+    """
+    s = _DarmStats()
+    if _lib.darm_stats(byref(s)) < 0:
+        raise RuntimeError('libdarm has been built without DARM_STATS')
+
+    encodings = dict((Encoding(idx), (count, s.enctype_cycles[idx]))
+                     for idx, count in enumerate(s.enctype_count) if count)
+    instructions = dict((Instruction(idx), count)
+                        for idx, count in enumerate(s.instr_count) if count)
+    return dict(encodings=encodings, instructions=instructions)
+
+
+def reset_stats():
+    """Resets the counters returned by stats()."""
+    _lib.darm_stats_reset()
+
+
+def set_quiet(quiet=True):
+    """Enables or disables quiet mode, in which libdarm no longer reports
+    failures on stderr, which speeds up sweeps over data considerably. The
+    failures remain available through last_error() and errors().
+
+    """
+    _lib.darm_set_quiet(bool(quiet))
+
+
+def last_error():
+    """Returns the reason of the last failure of the calling thread, such as
+    'LOOKUP' or 'UNHANDLED', or None if there was none yet.
+
+    """
+    err = _lib.darm_last_error()
+    return _error_names[err] if err else None
+
+
+def errors():
+    """Returns a dictionary mapping the reason of every failure seen so far,
+    in any thread, to the amount of times it occurred.
+
+    """
+    ret = {}
+    for err, name in enumerate(_error_names):
+        count = _lib.darm_error_count(err)
+        if err and count:
+            ret[name] = count
+    return ret
+
+
+def reset_errors():
+    """Resets the counters returned by errors()."""
+    _lib.darm_errors_reset()
+
+
+def disasm(w):
+    if _cache is not None:
+        return _cache.get(('arm', w), _disasm, w)
+    return _disasm(w)
+
+
 def disasm_thumb(w):
-	d = _Darm()
-	ret = _lib.darm_thumb_disasm(byref(d), w)
-	return Darm(d) if ret == 0 else None
+    if _cache is not None:
+        return _cache.get(('thumb', w), _disasm_thumb, w)
+    return _disasm_thumb(w)
+
+
+def disasm_thumb2(w, w2=0):
+    if _cache is not None:
+        # the second halfword is ignored for 16-bit instructions
+        key = (w << 16) | w2 if _is_thumb2_32bit(w) else w
+        return _cache.get(('thumb2', key), _disasm_thumb2, w, w2)
+    return _disasm_thumb2(w, w2)
+
+
+def _is_thumb2_32bit(w):
+    return (w >> 13) & 0b111 == 0b111 and (w >> 11) & 0b11 != 0b00
+
+
+def disasm_thumb2_bytes(buf, offset=0):
+    """Disassemble a little-endian encoded thumb or thumb2 instruction.
+
+    Whether the instruction is 16-bit or 32-bit wide is detected from its
+    first halfword. Returns a (Darm, length) tuple, with Darm being None if
+    the instruction could not be decoded, and length being the amount of
+    bytes the instruction takes, or zero if buf is too short to contain it.
+
+    """
+    addr, keep = _buffer(buf)
+    d = _Darm()
+    size = _lib.darm_thumb2_disasm_bytes(byref(d), addr + offset,
+                                         max(len(buf) - offset, 0))
+    return Darm(d) if size and d.instr else None, size
+
+# the amount of instructions that are decoded by a single native call
+_BATCH = 0x10000
+
+_modes = {'arm': 0, 'thumb': 1}
+
+# the size of the buffer that format_buffer renders a listing into
+_LISTING = 0x100000
+
+
+def _buffer(buf):
+    """Returns the address of a buffer, and an object keeping it alive."""
+    if isinstance(buf, bytes):
+        return cast(c_char_p(buf), c_void_p).value, buf
+
+    try:
+        arr = (c_char * len(buf)).from_buffer(buf)
+    except TypeError:
+        # read-only buffers can't be shared with ctypes, so copy them
+        arr = (c_char * len(buf)).from_buffer_copy(buf)
+    return addressof(arr), arr
+
+
+def _column(arr, start, stop, name):
+    """A 32-bit member of a range of rows of an array of _Darm structures,
+    which is read at once, rather than going through ctypes for each row."""
+    words = (c_int32 * ((stop - start) * sizeof(_Darm) // 4)).from_buffer(
+        arr, start * sizeof(_Darm))
+    return words[getattr(_Darm, name).offset // 4::sizeof(_Darm) // 4]
+
+
+class Disassembly(Sequence):
+    """Sequence of (address, Darm) tuples, with Darm being None for
+    instructions that could not be decoded.
+
+    The instructions stay in the array of _Darm structures that libdarm
+    decoded them into, and a Darm object is only created once its
+    instruction is accessed. Every Darm gets a copy of its own structure,
+    so keeping a few instructions doesn't keep the entire array alive.
+
+    """
+    def __init__(self, arr, start, stop, base):
+        self._arr = arr
+        self._start = start
+        self._stop = stop
+        self._base = base
+        self._addresses = None
+
+    def _address_list(self):
+        """The address of every instruction followed by the end address."""
+        if self._addresses is None:
+            addr = self._base
+            ret = [addr]
+            for size in _column(self._arr, self._start, self._stop,
+                                'size'):
+                addr += size
+                ret.append(addr)
+            self._addresses = ret
+        return self._addresses
+
+    def _end(self):
+        return self._address_list()[-1]
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[x] for x in range(*idx.indices(len(self)))]
+
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('instruction index out of range')
+
+        d = _Darm.from_buffer_copy(self._arr,
+                                   (self._start + idx) * sizeof(_Darm))
+        return self._address_list()[idx], Darm(d) if d.instr else None
+
+    def __iter__(self):
+        copy, size = _Darm.from_buffer_copy, sizeof(_Darm)
+        rows = zip(range(self._start, self._stop), self._address_list(),
+                   _column(self._arr, self._start, self._stop, 'instr'))
+
+        # the array may be replaced by parallel_disasm while iterating
+        for row, addr, instr in rows:
+            yield addr, Darm(copy(self._arr, row * size)) if instr else None
+
+    def __repr__(self):
+        return 'Disassembly(%r)' % list(self)
+
+
+def _decode(addr, length, mode, base, limit=_BATCH):
+    """Decodes up to limit instructions, or the entire buffer if limit is
+    None, into a Disassembly. In the latter case, bytes at the end of the
+    buffer that are too few for an instruction are added as an instruction
+    that could not be decoded."""
+    if mode not in _modes:
+        raise ValueError('invalid mode %r, expected arm or thumb' % mode)
+
+    # thumb buffers generally contain less instructions than halfwords, so
+    # they're counted first in order to allocate exactly enough structures,
+    # where limit instructions always fit in limit words
+    if limit is not None:
+        length = min(length, 4 * limit)
+    end = c_size_t()
+    count = _lib.darm_buffer_count(addr, length, _modes[mode], byref(end))
+    if limit is not None:
+        count = min(limit, count)
+
+    partial = length - end.value if limit is None else 0
+    arr = (_Darm * (count + (partial != 0)))()
+    if count != 0:
+        _lib.darm_disasm_buffer_cached(
+            arr, count, addr, length, _modes[mode],
+            byref(_cache.native()) if _cache is not None else None)
+    if partial != 0:
+        arr[count].size = partial
+    return Disassembly(arr, 0, len(arr), base)
+
+
+def _iter_disasm(addr, length, mode, base):
+    off = 0
+    while True:
+        rows = _decode(addr + off, length - off, mode, base + off)
+        if not rows:
+            break
+
+        for row in rows:
+            yield row
+        off = rows._end() - base
+
+    # the bytes at the end that are too few for an instruction
+    if off != length:
+        yield base + off, None
+
+
+def disasm_buffer(buf, mode='arm', base=0):
+    """Disassemble a buffer of little-endian encoded instructions.
+
+    The buffer is decoded by a single native call. Returns a Disassembly,
+    a sequence of (address, Darm) tuples, with Darm being None for
+    instructions that could not be decoded, which includes the bytes at the
+    end of the buffer if they're too few for an instruction.
+
+    """
+    addr, keep = _buffer(buf)
+    return _decode(addr, len(buf), mode, base, None)
+
+
+def iter_disasm(stream, mode='arm', base=0, chunk_size=0x100000):
+    """Disassemble the contents of a file-like object, chunk by chunk.
+
+    This is a generator yielding (address, Darm) tuples. The bytes of an
+    instruction that crosses a chunk boundary, e.g., a 32-bit thumb2
+    instruction of which only the first halfword has been read, are carried
+    over to the next chunk. Like with disasm_buffer, bytes at the end of the
+    stream that are too few for an instruction are yielded as an instruction
+    that could not be decoded.
+
+    """
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+
+        buf = pending + chunk
+        addr, keep = _buffer(buf)
+
+        off = 0
+        while True:
+            rows = _decode(addr + off, len(buf) - off, mode, base)
+            if not rows:
+                break
+
+            for row in rows:
+                yield row
+            off += rows._end() - base
+            base = rows._end()
+
+        pending = buf[off:]
+
+    if pending:
+        yield base, None
+
+
+def disasm_file(path, offset=0, length=None, mode='arm', base=0):
+    """Disassemble (a part of) a file by memory-mapping it.
+
+    The native decoder reads the instructions directly from the mapped
+    pages. This is a generator yielding (address, Darm) tuples, where the
+    address is the offset in the file plus base, and the bytes at the end
+    are handled like those of iter_disasm.
+
+    """
+    f = open(path, 'rb')
+    try:
+        if length is None:
+            length = os.fstat(f.fileno()).st_size - offset
+        if length <= 0:
+            return
+
+        # the offset of a mapping has to be aligned
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+
+        # a copy-on-write mapping can be shared with ctypes without copying
+        m = mmap.mmap(f.fileno(), length + offset - start,
+                      access=mmap.ACCESS_COPY, offset=start)
+    finally:
+        f.close()
+
+    try:
+        buf = (c_char * len(m)).from_buffer(m)
+        try:
+            for row in _iter_disasm(addressof(buf) + offset - start, length,
+                                    mode, base + offset):
+                yield row
+        finally:
+            # the mapping can't be closed while ctypes refers to it
+            del buf
+    finally:
+        m.close()
+
+
+def _parallel_shard(path, name, begin, end, mode):
+    """Decodes the instructions of one shard into a shared memory block.
+
+    Decoding may run at most one instruction past the end of the shard, in
+    order to complete a thumb2 instruction that crosses the boundary.
+    Returns the amount of instructions that start before the end of the
+    shard, and the offset following the last of them.
+
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        f = open(path, 'rb')
+        try:
+            size = os.fstat(f.fileno()).st_size
+            start = begin - begin % mmap.ALLOCATIONGRANULARITY
+            m = mmap.mmap(f.fileno(), min(end + 2, size) - start,
+                          access=mmap.ACCESS_COPY, offset=start)
+        finally:
+            f.close()
+
+        try:
+            buf = (c_char * len(m)).from_buffer(m)
+            arr = (_Darm * _shard_count(begin, end, mode)).from_buffer(shm.buf)
+            count = _lib.darm_disasm_buffer(arr, len(arr),
+                                            addressof(buf) + begin - start,
+                                            len(m) - begin + start,
+                                            _modes[mode])
+
+            # find the end of the shard here, rather than while merging
+            sizes = _column(arr, 0, count, 'size')
+            offsets = list(itertools.accumulate(sizes, initial=begin))
+            rows = min(bisect.bisect_left(offsets, end), count)
+            del buf, arr
+        finally:
+            m.close()
+    finally:
+        shm.close()
+    return rows, offsets[rows]
+
+
+def _shard_count(begin, end, mode):
+    """Upper bound of the amount of instructions in a shard."""
+    return (end - begin) // (4 if mode == 'arm' else 2)
+
+# the amount of bytes a thumb shard is decoded ahead of its own start in
+# order to synchronize with the instruction stream of the previous shard
+_OVERLAP = 0x40
+
+
+def parallel_disasm(path, mode='arm', workers=None, base=0,
+                    shard_size=0x100000):
+    """Disassemble a file using multiple processes.
+
+    The file is split into aligned shards that are decoded in parallel by
+    libdarm, each into its own shared memory block, after which the shards
+    are merged in address order. Thumb shards overlap the previous shard
+    by a few instructions, and decoding of a shard resumes at the first
+    instruction that lines up with the end of the previous shard - falling
+    back to decoding in this process if none does - so the result is equal
+    to that of disasm_file.
+
+    This is a generator yielding a Disassembly for every shard, and for
+    every instruction that was decoded while resynchronizing, rather than
+    creating the Darm objects of all instructions in this process. Use
+    itertools.chain.from_iterable() for the (address, Darm) tuples.
+
+    """
+    if shared_memory is None:
+        raise ImportError('parallel_disasm requires Python 3.8 or newer')
+
+    if mode not in _modes:
+        raise ValueError('invalid mode %r, expected arm or thumb' % mode)
+
+    shard_size -= shard_size % 4
+    if shard_size <= 0:
+        raise ValueError('invalid shard size %r' % shard_size)
+
+    size = os.path.getsize(path)
+    overlap = _OVERLAP if mode == 'thumb' else 0
+    shards = [(max(off - overlap, 0), min(off + shard_size, size))
+              for off in range(0, size - size % 2, shard_size)]
+    if not shards:
+        # a file of a single byte is too short for an instruction
+        if size != 0:
+            yield _disasm_file_at(path, 0, mode, base, None)
+        return
+
+    workers = workers or os.cpu_count()
+    executor = ProcessPoolExecutor(workers)
+
+    # every shard that is being decoded or has been yielded occupies one of
+    # the shared memory blocks, which are reused once a shard is done with
+    slots = [shared_memory.SharedMemory(create=True, size=sizeof(_Darm) *
+                                        _shard_count(0, shard_size + overlap,
+                                                     mode))
+             for _ in range(min(2 * workers + 1, len(shards)))]
+
+    pending = collections.deque()
+    try:
+        for idx, slot in enumerate(slots):
+            begin, end = shards[idx]
+            pending.append((slot, executor.submit(
+                _parallel_shard, path, slot.name, begin, end, mode)))
+
+        # weak references to the yielded shards, which are views on the
+        # shared memory blocks, along with their blocks and indices
+        views = collections.deque()
+
+        pos = 0
+        for idx, (begin, end) in enumerate(shards):
+            slot, future = pending.popleft()
+            count, stop = future.result()
+            arr = (_Darm * count).from_buffer(slot.buf)
+
+            # skip the instructions that were merged from the previous
+            # shard already, if the previous shard ended in an instruction
+            # that was not decoded by this shard, resynchronize by decoding
+            # the next instruction in this process
+            off, row = begin, 0
+            while row < count and off < pos:
+                off += arr[row].size
+                row += 1
+
+                while off > pos and pos < end:
+                    rows = _disasm_file_at(path, pos, mode, base)
+                    if not rows:
+                        # the file ends in the middle of this instruction
+                        yield _disasm_file_at(path, pos, mode, base, None)
+                        return
+                    yield rows
+                    pos = rows._end() - base
+
+            # the rest of the shard lines up with the previous one
+            rows = Disassembly(arr, row, count, base + pos)
+            views.append((idx, slot, weakref.ref(rows)))
+            if row < count and pos < end:
+                yield rows
+                pos = stop
+            rows = arr = None
+
+            # the block of the shard before this one is reused for another
+            # shard, once the loop of the caller moved on from it, so if it
+            # is still being referenced, it's copied out of the block first
+            if len(views) > 1:
+                done, block, view = views.popleft()
+                _release(view)
+
+                if done + len(slots) < len(shards):
+                    begin, end = shards[done + len(slots)]
+                    pending.append((block, executor.submit(
+                        _parallel_shard, path, block.name, begin, end, mode)))
+
+        # the bytes at the end that are too few for an instruction
+        if pos < size:
+            yield _disasm_file_at(path, pos, mode, base, None)
+    finally:
+        rows = arr = None
+        for done, block, view in views:
+            _release(view)
+
+        for slot, future in pending:
+            future.cancel()
+        executor.shutdown()
+
+        for slot in slots:
+            slot.close()
+            slot.unlink()
+
+
+def _release(view):
+    """Copies a Disassembly, if it's still alive, out of the shared memory
+    block of its shard."""
+    rows = view()
+    if rows is not None:
+        rows._arr = (_Darm * len(rows._arr)).from_buffer_copy(rows._arr)
+
+
+def _disasm_file_at(path, off, mode, base, limit=1):
+    """Decodes a single instruction at the given offset of a file, see
+    _decode() for limit."""
+    f = open(path, 'rb')
+    try:
+        f.seek(off)
+        addr, keep = _buffer(f.read(4))
+        return _decode(addr, len(keep), mode, base + off, limit)
+    finally:
+        f.close()
+
+
+def format_buffer(buf, mode='arm', lowercase=True, base=0):
+    """Render an objdump-like listing of a buffer.
+
+    Each line contains the address, the encoded instruction and its text
+    representation, and is rendered by libdarm without holding the GIL.
+    Returns the entire listing as a single string.
+
+    """
+    if mode not in _modes:
+        raise ValueError('invalid mode %r, expected arm or thumb' % mode)
+
+    addr, keep = _buffer(buf)
+    out, outlen = create_string_buffer(_LISTING), c_size_t()
+    ret = []
+
+    off = 0
+    while True:
+        outlen.value = len(out)
+        count = _lib.darm_format_buffer(out, byref(outlen), addr + off,
+                                        len(buf) - off, _modes[mode],
+                                        (base + off) & 0xffffffff,
+                                        lowercase)
+        if count == 0:
+            break
+
+        ret.append(string_at(out, outlen.value))
+        off += count
+    return _str(b''.join(ret))
+
+
+def disasm_array(buf, mode='arm'):
+    """Disassemble a buffer into a NumPy structured array.
+
+    The dtype of the array mirrors the _Darm structure, and the array is
+    filled directly by libdarm in a single call, during which the GIL is
+    released, so threads disassembling different buffers run in parallel.
+    Rows of instructions that could not be decoded have their instr field
+    set to zero (I_INVLD). The offset of each instruction is
+    numpy.cumsum(arr['size']) - arr['size'].
+
+    """
+    if numpy is None:
+        raise ImportError('disasm_array requires numpy')
+
+    if mode not in _modes:
+        raise ValueError('invalid mode %r, expected arm or thumb' % mode)
+
+    addr, keep = _buffer(buf)
+    arr = numpy.empty(len(buf) // (4 if mode == 'arm' else 2),
+                      dtype=dtypes['darm_t'])
+    count = _lib.darm_disasm_buffer_cached(
+        arr.ctypes.data_as(POINTER(_Darm)), len(arr), addr, len(buf),
+        _modes[mode], byref(_cache.native()) if _cache is not None else None)
+
+    # thumb buffers generally contain less instructions than halfwords
+    return arr[:count].copy() if count != len(arr) else arr
 
-def disasm_thumb2(w):
-	d = _Darm()
-	ret = _lib.darm_thumb2_disasm(byref(d), w)
-	return Darm(d) if ret == 0 else None
 
 def _set_func(name, restype, *argtypes):
     getattr(_lib, name).restype = restype
     getattr(_lib, name).argtypes = argtypes
 
-_lib = cdll.LoadLibrary('libdarm.so')
+# ctypes releases the GIL for the duration of every call through cdll, and
+# as libdarm is reentrant the batch functions, which decode up to _BATCH
+# instructions per call, may be called from multiple threads at once
+_lib = cdll.LoadLibrary(os.environ.get('DARM_LIBRARY', 'libdarm.so'))
+_check_layout(_lib)
 _set_func('darm_armv7_disasm', c_int32, POINTER(_Darm), c_uint32)
+_set_func('darm_thumb_disasm', c_int32, POINTER(_Darm), c_uint16)
+_set_func('darm_thumb2_disasm', c_int32, POINTER(_Darm), c_uint16, c_uint16)
+_set_func('darm_thumb2_disasm_bytes', c_uint32, POINTER(_Darm), c_void_p,
+          c_size_t)
 _set_func('darm_mnemonic_name', c_char_p, c_uint32)
 _set_func('darm_enctype_name', c_char_p, c_uint32)
 _set_func('darm_register_name', c_char_p, c_int32)
@@ -282,3 +1115,41 @@ _set_func('darm_condition_name', c_char_p, c_int32, c_int32)
 _set_func('darm_reglist', c_int32, c_uint16, c_char_p)
 _set_func('darm_str', c_int32, POINTER(_Darm), POINTER(_DarmStr))
 _set_func('darm_str2', c_int32, POINTER(_Darm), POINTER(_DarmStr), c_int32)
+_set_func('darm_operands', c_int32, POINTER(_Darm), POINTER(_DarmOperand))
+_set_func('darm_format_buffer', c_size_t, c_char_p, POINTER(c_size_t),
+          c_void_p, c_size_t, c_int32, c_uint32, c_int32)
+_set_func('darm_cache_init', c_int32, POINTER(_DarmCache),
+          POINTER(_DarmCacheEntry), c_uint32)
+_set_func('darm_disasm_buffer_cached', c_size_t, POINTER(_Darm), c_size_t,
+          c_void_p, c_size_t, c_int32, POINTER(_DarmCache))
+_set_func('darm_disasm_buffer', c_size_t, POINTER(_Darm), c_size_t, c_void_p,
+          c_size_t, c_int32)
+_set_func('darm_buffer_count', c_size_t, c_void_p, c_size_t, c_int32,
+          POINTER(c_size_t))
+_set_func('darm_stats', c_int32, c_void_p)
+_set_func('darm_stats_reset', None)
+_set_func('darm_set_quiet', None, c_int32)
+_set_func('darm_last_error', c_int32)
+_set_func('darm_error_count', c_uint64, c_int32)
+_set_func('darm_errors_reset', None)
+_set_func('darm_error_name', c_char_p, c_int32)
+
+
+def _table_size(lookup):
+    idx = 0
+    while lookup(idx) is not None:
+        idx += 1
+    return idx
+
+# registers r0..r15, s0..s31, d0..d31 and q0..q15, and R_INVLD
+Register._intern(range(-1, _table_size(Register._lookup)))
+Condition._intern(range(-1, 16))
+Instruction._intern(range(_table_size(Instruction._lookup)))
+Encoding._intern(range(_table_size(Encoding._lookup)))
+
+_error_names = [_str(_lib.darm_error_name(idx))
+                for idx in range(_table_size(_lib.darm_error_name))]
+
+_shift_type_names = dict((idx, _str(_lib.darm_shift_type_name(idx)))
+                         for idx in range(4))
+
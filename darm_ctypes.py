@@ -0,0 +1,184 @@
+"""
+Copyright (c) 2013, Jurriaan Bremer
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the darm developer(s) nor the names of its
+  contributors may be used to endorse or promote products derived from this
+  software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+"""
+# This file was generated by darmgen.py from darm.h. Do not edit!
+from ctypes import Structure, POINTER, sizeof
+from ctypes import c_char, c_int32, c_uint16, c_uint32, c_uint64, c_uint8
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class _Darm(Structure):
+    # darm_t
+    _fields_ = [
+        ('w', c_uint32),
+        ('instr', c_uint32),
+        ('instr_type', c_uint32),
+        ('size', c_uint32),
+        ('cond', c_int32),
+        ('B', c_uint32),
+        ('S', c_uint32),
+        ('E', c_uint32),
+        ('M', c_uint32),
+        ('N', c_uint32),
+        ('option', c_int32),
+        ('U', c_uint32),
+        ('H', c_uint32),
+        ('P', c_uint32),
+        ('R', c_uint32),
+        ('T', c_uint32),
+        ('W', c_uint32),
+        ('I', c_uint32),
+        ('rotate', c_uint32),
+        ('dtype', c_uint32),
+        ('stype', c_uint32),
+        ('Rd', c_int32),
+        ('Rn', c_int32),
+        ('Rm', c_int32),
+        ('Ra', c_int32),
+        ('Rt', c_int32),
+        ('Rt2', c_int32),
+        ('RdHi', c_int32),
+        ('RdLo', c_int32),
+        ('imm', c_uint32),
+        ('shift_type', c_int32),
+        ('Rs', c_int32),
+        ('shift', c_uint32),
+        ('lsb', c_uint32),
+        ('width', c_uint32),
+        ('reglist', c_uint16),
+        ('ext_registers', c_uint16),
+        ('cpsr', c_uint32),
+        ('mode', c_int32),
+    ]
+
+
+class _DarmStr(Structure):
+    # darm_str_t
+    _fields_ = [
+        ('mnemonic', c_char * 24),
+        ('arg', c_char * 32 * 4),
+        ('shift', c_char * 12),
+        ('instr', c_char * 64),
+    ]
+
+
+class _DarmOperand(Structure):
+    # darm_operand_t
+    _fields_ = [
+        ('type', c_uint32),
+        ('reg', c_int32),
+        ('index', c_int32),
+        ('imm', c_uint32),
+        ('subtract', c_uint32),
+        ('shift_type', c_int32),
+        ('Rs', c_int32),
+        ('shift', c_uint32),
+        ('reglist', c_uint16),
+        ('count', c_uint16),
+        ('writeback', c_uint32),
+    ]
+
+
+class _DarmCacheEntry(Structure):
+    # darm_cache_entry_t
+    _fields_ = [
+        ('w', c_uint32),
+        ('mode', c_int32),
+        ('error', c_uint32),
+        ('errors', c_uint8 * 6),
+        ('d', _Darm),
+    ]
+
+
+class _DarmCache(Structure):
+    # darm_cache_t
+    _fields_ = [
+        ('entries', POINTER(_DarmCacheEntry)),
+        ('count', c_uint32),
+        ('hits', c_uint64),
+        ('misses', c_uint64),
+        ('evictions', c_uint64),
+    ]
+
+
+class _DarmStats(Structure):
+    # darm_stats_t
+    _fields_ = [
+        ('enctype_count', c_uint64 * 68),
+        ('enctype_cycles', c_uint64 * 68),
+        ('instr_count', c_uint64 * 365),
+    ]
+
+
+# the size of each structure followed by the offset and size of
+# each of its members, which is what darm_layout in libdarm holds
+def _layout():
+    ret = []
+    for struct in (_Darm, _DarmStr, _DarmOperand, _DarmCacheEntry, _DarmCache,
+                   _DarmStats):
+        ret.append(sizeof(struct))
+        for name, _ in struct._fields_:
+            ret += [getattr(struct, name).offset, getattr(struct, name).size]
+    return ret
+
+
+def check(lib):
+    """Raises ImportError if the structures above don't match the ones
+    of lib, i.e., if it was built from a different darm.h."""
+    count = c_uint32.in_dll(lib, 'darm_layout_count').value
+    layout = (c_uint32 * count).in_dll(lib, 'darm_layout')
+    if list(layout) != _layout():
+        raise ImportError('the structures of darm_ctypes.py don\'t match '
+                          'libdarm, rebuild both with make')
+
+
+def _dtype(struct, formats):
+    names = [x[0] for x in struct._fields_]
+    return numpy.dtype({'names': names, 'formats': formats,
+                        'offsets': [getattr(struct, x).offset for x in names],
+                        'itemsize': sizeof(struct)})
+
+# NumPy dtypes of the structures without pointers, by their name in darm.h
+dtypes = {}
+if numpy is not None:
+    dtypes['darm_t'] = _dtype(_Darm, ['u4', 'u4', 'u4', 'u4', 'i4', 'u4', 'u4',
+        'u4', 'u4', 'u4', 'i4', 'u4', 'u4', 'u4', 'u4', 'u4', 'u4', 'u4', 'u4',
+        'u4', 'u4', 'i4', 'i4', 'i4', 'i4', 'i4', 'i4', 'i4', 'i4', 'u4', 'i4',
+        'i4', 'u4', 'u4', 'u4', 'u2', 'u2', 'u4', 'i4'])
+    dtypes['darm_str_t'] = _dtype(_DarmStr, ['S24', ('S32', (4,)), 'S12',
+        'S64'])
+    dtypes['darm_operand_t'] = _dtype(_DarmOperand, ['u4', 'i4', 'i4', 'u4',
+        'u4', 'i4', 'i4', 'u4', 'u2', 'u2', 'u4'])
+    dtypes['darm_cache_entry_t'] = _dtype(_DarmCacheEntry, ['u4', 'i4', 'u4',
+        ('u1', (6,)), dtypes['darm_t']])
+    dtypes['darm_stats_t'] = _dtype(_DarmStats, [('u8', (68,)), ('u8', (68,)),
+        ('u8', (365,))])
@@ -32,7 +32,13 @@ import darmtblthumb
 import darmtblthumb2
 import darmtblvfp
 import darmtblneon
+import cPickle
+import collections
+import hashlib
 import itertools
+import math
+import os
+import StringIO
 import string
 import sys
 import textwrap
@@ -70,23 +76,180 @@ def struct_definition(name, arr):
         string.join(['    ' + a[i][1] + '  ' + a[i][0] + ';' for i in range(len(arr))], '\n') +\
         '} %s;\n\n' % (name)
 
+# structures of darm.h which are mirrored by darm_ctypes.py
+ctypes_structures = 'darm_t', 'darm_str_t', 'darm_operand_t', \
+    'darm_cache_entry_t', 'darm_cache_t', 'darm_stats_t'
+
+ctypes_types = {
+    'char': ('c_char', 'S1'),
+    'uint8_t': ('c_uint8', 'u1'), 'int8_t': ('c_int8', 'i1'),
+    'uint16_t': ('c_uint16', 'u2'), 'int16_t': ('c_int16', 'i2'),
+    'uint32_t': ('c_uint32', 'u4'), 'int32_t': ('c_int32', 'i4'),
+    'uint64_t': ('c_uint64', 'u8'), 'int64_t': ('c_int64', 'i8'),
+}
+
+def c_structures(text, names, constants):
+    """Parses the definitions of the structures names from text, the
+    contents of darm.h, into a list of (name, members) tuples, members being
+    (name, type, pointer, dimensions) tuples. Array dimensions are either
+    numbers or one of the constants."""
+    text = re.sub(r'//.*', '', text)
+    ret = []
+    for name in names:
+        m = re.search(r'typedef struct _%s \{(.*?)\} %s;' % (name, name),
+                      text, re.S)
+        assert m, 'structure %s not found in darm.h' % name
+
+        members = []
+        for line in m.group(1).split(';')[:-1]:
+            member = re.match(r'\s*(\w+)\s*(\*?)\s*(\w+)((\[[^\]]+\])*)\s*$',
+                              line)
+            assert member, 'unsupported member in %s: %s' % (name, line)
+            typ, ptr, field, dims = member.group(1, 2, 3, 4)
+            dims = [int(x) if x.isdigit() else constants[x]
+                    for x in re.findall(r'\[([^\]]+)\]', dims)]
+            members.append((field, typ, ptr == '*', dims))
+        ret.append((name, members))
+    return ret
+
+def enum_signedness(text):
+    """Maps the enumerations defined in text to whether they have negative
+    values, such as R_INVLD = -1."""
+    return dict((name, '= -' in body) for body, name in re.findall(
+        r'typedef enum _\w+ \{(.*?)\} (\w+);', re.sub(r'//.*', '', text),
+        re.S))
+
+def ctypes_name(name):
+    """Name of the ctypes structure of a darm.h structure, e.g., darm_str_t
+    is _DarmStr."""
+    return '_' + ''.join(x.capitalize() for x in name[:-2].split('_'))
+
+def ctypes_module(structs, enums):
+    """darm_ctypes.py, the ctypes structures and the NumPy dtypes mirroring
+    the structures of darm.h, and the layout check against libdarm."""
+    def member_type(typ, ptr, dims):
+        """The ctypes type and the NumPy format of a member."""
+        if typ in enums:
+            typ = 'int32_t' if enums[typ] else 'uint32_t'
+
+        if ptr:
+            return 'POINTER(%s)' % ctypes_name(typ), None
+
+        if typ in ctypes_types:
+            ctype, fmt = ctypes_types[typ]
+            fmt = repr(fmt)
+        else:
+            ctype, fmt = ctypes_name(typ), 'dtypes[%r]' % typ
+        ctype += ''.join(' * %d' % x for x in reversed(dims))
+
+        # numpy represents character arrays as strings
+        if typ == 'char' and dims:
+            fmt, dims = repr('S%d' % dims[-1]), dims[:-1]
+        if dims:
+            fmt = '(%s, (%s,))' % (fmt, ', '.join(str(x) for x in dims))
+        return ctype, fmt
+
+    lines, formats = [], []
+    for name, members in structs:
+        lines += ['', '', 'class %s(Structure):' % ctypes_name(name),
+                  '    # %s' % name, '    _fields_ = [']
+        fmts = []
+        for field, typ, ptr, dims in members:
+            ctype, fmt = member_type(typ, ptr, dims)
+            lines.append("        ('%s', %s)," % (field, ctype))
+            fmts.append(fmt)
+        lines.append('    ]')
+
+        # structures with pointers have no dtype
+        if None not in fmts:
+            formats.append((name, fmts))
+
+    used = sorted(set(re.findall(r'c_\w+', '\n'.join(lines))) | set(['c_uint32']))
+    lines = ['"""', __doc__.strip(), '"""',
+             '# This file was generated by darmgen.py from darm.h. Do not edit!',
+             'from ctypes import Structure, POINTER, sizeof',
+             'from ctypes import ' + ', '.join(used),
+             '',
+             'try:',
+             '    import numpy',
+             'except ImportError:',
+             '    numpy = None'] + lines
+    lines += ['', '',
+              '# the size of each structure followed by the offset and size of',
+              '# each of its members, which is what darm_layout in libdarm holds',
+              'def _layout():',
+              '    ret = []'] + \
+        textwrap.wrap('    for struct in (%s):' % ', '.join(
+            ctypes_name(name) for name, _ in structs), 79,
+            subsequent_indent=' ' * 19) + \
+             ['        ret.append(sizeof(struct))',
+              '        for name, _ in struct._fields_:',
+              '            ret += [getattr(struct, name).offset, '
+              'getattr(struct, name).size]',
+              '    return ret',
+              '', '',
+              'def check(lib):',
+              '    """Raises ImportError if the structures above don\'t match '
+              'the ones',
+              '    of lib, i.e., if it was built from a different darm.h."""',
+              "    count = c_uint32.in_dll(lib, 'darm_layout_count').value",
+              "    layout = (c_uint32 * count).in_dll(lib, 'darm_layout')",
+              '    if list(layout) != _layout():',
+              "        raise ImportError('the structures of darm_ctypes.py don\\'t "
+              "match '",
+              "                          'libdarm, rebuild both with make')",
+              '', '',
+              'def _dtype(struct, formats):',
+              '    names = [x[0] for x in struct._fields_]',
+              "    return numpy.dtype({'names': names, 'formats': formats,",
+              "                        'offsets': [getattr(struct, x).offset "
+              "for x in names],",
+              "                        'itemsize': sizeof(struct)})",
+              '',
+              '# NumPy dtypes of the structures without pointers, by their '
+              'name in darm.h',
+              'dtypes = {}',
+              'if numpy is not None:']
+    for name, fmts in formats:
+        text = '    dtypes[%r] = _dtype(%s, [%s])' % (name, ctypes_name(name),
+                                                   ', '.join(fmts))
+        lines += textwrap.wrap(text, 79, subsequent_indent=' ' * 8,
+                               break_long_words=False, break_on_hyphens=False)
+    return '\n'.join(lines) + '\n'
+
+def layout_source(structs):
+    """darm-layout.c, the layout of the structures of darm.h as checked by
+    darm_ctypes.py."""
+    lines = ['#include <stddef.h>', '#include "darm.h"', '',
+             '#define MEMBER(type, member) \\',
+             '    offsetof(type, member), sizeof(((type *) 0)->member)', '',
+             'const uint32_t darm_layout[] = {']
+    for name, members in structs:
+        lines.append('    sizeof(%s),' % name)
+        lines += ['    MEMBER(%s, %s),' % (name, x[0]) for x in members]
+    lines += ['};', '',
+              'const uint32_t darm_layout_count = ARRAYSIZE(darm_layout);']
+    return '\n'.join(lines) + '\n'
+
 def bins(n, l):
     s = bin(n)
     while len(s) - 2 < l:
         s = s[:2] + '0' + s[2:]
     return s
 
+def instruction_lookup_entry(arr, k):
+    """Entry of an instruction lookup table."""
+    if not arr.has_key(k):
+        return '{ I_INVLD, T_INVLD, 0}'
+    a = arr[k]
+    return '{ I_%s, T_%s, %s}' % (a[0], a[1][1], pooled_format([a[2]]))
+
 def instruction_lookup_table(arr, size, kind):
     """Lookup table for all relevant instruction features."""    
     values = []
     t = 2**size
     for k in range(t):
-        s = ''
-        if not arr.has_key(k):
-            s += '{ I_INVLD, T_INVLD, NULL}'
-        else:
-            a = arr[k]
-            s += '{ I_%s, T_%s, "%s"}' % (a[0], a[1][1], a[2])
+        s = instruction_lookup_entry(arr, k)
         if k < t-1:
             s += ','
         s = '/* %s */ ' % (bins(k, size)) + s
@@ -95,6 +258,134 @@ def instruction_lookup_table(arr, size, kind):
     return 'darm_lookup_t %s_instr_lookup[%d] = {' % (kind, t) + \
         '\n' + string.join(values, '\n') + '\n};'
 
+def decision_tree(values, size):
+    """Builds a decision tree that maps each of the 2**size indices of a
+    table to the same entry as values does. Every node tests the bit of the
+    index that separates the remaining entries best, i.e., the one which
+    leaves the least entropy in both halves, and identical subtrees are
+    shared. Returns the distinct entries and the nodes, as (bit, next0,
+    next1) tuples with the root first, where next is either another node or
+    an entry, if DARM_TREE_LEAF is set."""
+    leaves = sorted(set(values), key=values.index)
+    leaf_index = dict((x, idx) for idx, x in enumerate(leaves))
+    nodes = {}
+
+    def entropy(arr):
+        n = float(len(arr))
+        return -sum(c / n * math.log(c / n, 2)
+                    for c in collections.Counter(arr).values())
+
+    def halves(arr, stride):
+        blocks = range(0, len(arr), 2 * stride)
+        return [x for k in blocks for x in arr[k:k+stride]], \
+            [x for k in blocks for x in arr[k+stride:k+2*stride]]
+
+    def build(arr, bits):
+        # bits holds the bit of the index each dimension of arr stands for,
+        # most significant first
+        if arr.count(arr[0]) == len(arr):
+            return 0x8000 | leaf_index[arr[0]]
+
+        best = None
+        for idx, bit in enumerate(bits):
+            lo, hi = halves(arr, 2**(len(bits) - 1 - idx))
+            score = entropy(lo) + entropy(hi)
+            if best is None or score < best[0]:
+                best = score, idx, lo, hi
+
+        _, idx, lo, hi = best
+        rest = bits[:idx] + bits[idx+1:]
+        key = bits[idx], build(lo, rest), build(hi, rest)
+        if key[1] == key[2]:
+            return key[1]
+        return nodes.setdefault(key, len(nodes))
+
+    root = build(list(values), range(size)[::-1])
+
+    # the root has to be a node, even if every index maps to one entry
+    if root & 0x8000:
+        nodes[0, root, root] = 0
+        root = 0
+
+    # number the nodes breadth-first, starting at the root
+    by_index = dict((v, k) for k, v in nodes.items())
+    order, queue = {}, [root]
+    while queue:
+        node = queue.pop(0)
+        if node & 0x8000 or node in order:
+            continue
+        order[node] = len(order)
+        queue += by_index[node][1:]
+
+    def ref(x):
+        return x if x & 0x8000 else order[x]
+
+    tree = [None] * len(order)
+    for node, idx in order.items():
+        bit, lo, hi = by_index[node]
+        tree[idx] = bit, ref(lo), ref(hi)
+
+    assert len(leaves) < 0x8000 and len(tree) < 0x8000
+    return leaves, tree
+
+def decision_tree_table(typ, name, values, size):
+    """Decision tree of a table, see decision_tree()."""
+    leaves, tree = decision_tree(values, size)
+    nodes = ['    {%d, {%s}},' % (bit, ', '.join(
+        'DARM_TREE_LEAF | %d' % (x & 0x7fff) if x & 0x8000 else '%d' % x
+        for x in (lo, hi))) for bit, lo, hi in tree]
+    return '%s %s_leaves[%d] = {\n%s\n};\n' % (
+        typ, name, len(leaves), '\n'.join('    %s,' % x for x in leaves)) + \
+        'const darm_tree_node_t %s_tree[%d] = {\n%s\n};\n' % (
+            name, len(tree), '\n'.join(nodes))
+
+def paged_table(typ, name, values, size):
+    """Two-level table of a table with 2**size entries. The distinct entries
+    are stored once, as leaves, and are referred to by blocks of indices,
+    where the low bits of the index select an index in a block, and the
+    high bits select the block through a page directory. Identical blocks
+    are only emitted once, and the amount of low bits is chosen to minimize
+    the total size. Returns the declarations and the definitions."""
+    leaves = sorted(set(values), key=values.index)
+    leaf_index = dict((x, idx) for idx, x in enumerate(leaves))
+    indices = [leaf_index[x] for x in values]
+
+    def inttype(count):
+        return (1, 'uint8_t') if count <= 0x100 else (2, 'uint16_t')
+
+    best = None
+    for low in range(size + 1):
+        chunks = [tuple(indices[k:k+2**low])
+                  for k in range(0, len(indices), 2**low)]
+        blocks = sorted(set(chunks), key=chunks.index)
+        total = len(blocks) * 2**low * inttype(len(leaves))[0] + \
+            len(chunks) * inttype(len(blocks))[0]
+        if best is None or total < best[0]:
+            best = total, low, chunks, blocks
+
+    _, low, chunks, blocks = best
+    block_index = dict((x, idx) for idx, x in enumerate(blocks))
+    blocktyp, pagetyp = inttype(len(leaves))[1], inttype(len(blocks))[1]
+
+    header = 'extern %s %s_leaves[%d];\n' % (typ, name, len(leaves)) + \
+        'extern const %s %s_blocks[%d][%d];\n' % (
+            blocktyp, name, len(blocks), 2**low) + \
+        'extern const %s %s_pages[%d];\n' % (pagetyp, name, len(chunks))
+
+    def numbers(arr, indent):
+        return ('\n' + indent).join(textwrap.wrap(
+            ', '.join('%d' % x for x in arr), 78 - len(indent)))
+
+    source = '%s %s_leaves[%d] = {\n%s\n};\n' % (
+        typ, name, len(leaves), '\n'.join('    %s,' % x for x in leaves))
+    source += 'const %s %s_blocks[%d][%d] = {\n%s\n};\n' % (
+        blocktyp, name, len(blocks), 2**low, '\n'.join(
+            '    {%s},' % numbers(x, '     ') for x in blocks))
+    source += 'const %s %s_pages[%d] = {\n    %s\n};\n' % (
+        pagetyp, name, len(chunks),
+        numbers([block_index[x] for x in chunks], '    '))
+    return header, source
+
 def instruction_name(x):
     return x.split('{')[0].split('<')[0].split()[0]
 
@@ -120,9 +411,23 @@ def typed_table(typ, name, arr):
     return '%s %s[] = {\n    %s\n};\n' % (typ, name, text)
 
 
+def pooled_string(s):
+    """Placeholder for the offset of s in darm_strings, see StringPool."""
+    assert '"' not in s and '\\' not in s
+    return 'DARM_STRING("%s")' % s
+
+
+def pooled_format(alternatives, strict=False):
+    """Placeholder for the offset of the program the format strings
+    compile to in darm_formats, see FormatPool."""
+    if strict:
+        alternatives = alternatives + ['?']
+    return 'DARM_FORMAT("%s")' % '|'.join(alternatives)
+
+
 def string_table(name, arr):
-    """A string table."""
-    return typed_table('const char *', name, ('"%s"' % x for x in arr))
+    """A string table, as offsets in darm_strings."""
+    return typed_table('const uint16_t', name, (pooled_string(x) for x in arr))
 
 
 def instruction_names_enum(arr):
@@ -363,9 +668,134 @@ def generate_format_strings(arr):
 
     return ret
 
+class StringPool:
+    """The strings of the generated tables are stored only once, in
+    darm_strings, and referred to by their 16-bit offset in it, with
+    offset 0 standing for a null pointer. The offsets are only known once
+    all strings are, so the tables refer to their strings through
+    pooled_string() placeholders until resolve() fills them in."""
+    placeholder = re.compile(r'DARM_STRING\("([^"]*)"\)')
+
+    def resolve(self, files):
+        """Replaces the placeholders in the files, a dictionary of file
+        names and their contents, and adds the pool to darm-tbl.c."""
+        strings = set()
+        for text in files.values():
+            strings.update(self.placeholder.findall(text))
+
+        offsets, offset = {}, 1
+        for x in sorted(strings):
+            offsets[x] = offset
+            offset += len(x) + 1
+        assert offset <= 0x10000, 'too many strings for 16-bit offsets'
+
+        for fname, text in files.items():
+            text = self.placeholder.sub(lambda m: 'DARM_STRING(%d, "%s")' %
+                                        (offsets[m.group(1)], m.group(1)),
+                                        text)
+            files[fname] = text
+
+        lines = ['    "%s\\0"' % x for x in sorted(strings)]
+        files['darm-tbl.c'] += 'const char darm_strings[%d] =\n' % offset + \
+            '    "\\0"\n' + '\n'.join(lines) + ';\n'
+
+class FormatPool:
+    """The format strings are compiled into programs for darm_str(), which
+    are stored in darm_formats and referred to by their 16-bit offset in
+    it, with offset 0 standing for no format at all.
+
+    A program is the format string without the characters that darm_str()
+    skips, terminated by a null byte. Every operand that may be missing is
+    followed by the offset in the program to continue at if it is, which
+    is the same position in the next alternative format string, or the end
+    of the program if there is none. The alternatives of strict formats
+    end in a ? instead, which darm_str() reports as an error."""
+    placeholder = re.compile(r'DARM_FORMAT\("([^"]*)"\)')
+
+    # the operands which may be missing, and the characters to skip
+    operands = 'dnm1at2hliXb'
+    skipped = '[]:{}64#-'
+
+    def compile(self, text):
+        alternatives = text.split('|')
+
+        # the position in the program of every offset in the alternatives
+        code, positions = [], []
+        for alternative in alternatives:
+            positions.append([])
+            for ch in alternative + '\0':
+                positions[-1].append(len(code))
+                if ch in self.skipped:
+                    continue
+
+                code.append(ch)
+                if ch in self.operands:
+                    code.append((len(positions), len(positions[-1]) - 1))
+
+        targets = set()
+        for idx, x in enumerate(code):
+            if isinstance(x, tuple):
+                alternative, offset = x
+                if alternative == len(alternatives):
+                    code[idx] = positions[-1][-1]
+                elif alternatives[alternative] == '?':
+                    code[idx] = positions[alternative][0]
+                else:
+                    code[idx] = positions[alternative][offset]
+                targets.add(code[idx])
+                code[idx] = chr(code[idx])
+
+        # the ? is dead code if none of the operands may be missing
+        if alternatives[-1] == '?' and positions[-1][0] not in targets:
+            code = code[:positions[-1][0]]
+
+        assert len(code) < 0x100, 'format program too long'
+        return ''.join(code)
+
+    def resolve(self, files):
+        """Replaces the placeholders in the files, a dictionary of file
+        names and their contents, and adds the pool to darm-tbl.c."""
+        formats = set()
+        for text in files.values():
+            formats.update(self.placeholder.findall(text))
+
+        # formats which compile to the same program share it
+        programs, offsets, offset = {}, {}, 1
+        for x in sorted(formats):
+            program = self.compile(x)
+            if program not in programs:
+                programs[program] = offset
+                offset += len(program)
+            offsets[x] = programs[program]
+        assert offset <= 0x10000, 'too many formats for 16-bit offsets'
+
+        for fname, text in files.items():
+            text = self.placeholder.sub(lambda m: 'DARM_FORMAT(%d, "%s")' %
+                                        (offsets[m.group(1)], m.group(1)),
+                                        text)
+            files[fname] = text
+
+        # every byte but letters and digits is escaped, as the programs
+        # hold offsets, and ?? would start a trigraph
+        lines = ['    "%s"' % ''.join(x if x.isalnum() else '\\%03o' % ord(x)
+                                      for x in program)
+                 for program, _ in sorted(programs.items(),
+                                          key=lambda x: x[1])]
+        files['darm-tbl.c'] += 'const uint8_t darm_formats[%d] =\n' % \
+            offset + '    "\\000"\n' + '\n'.join(lines) + ';\n'
+
+def write_file(fname, text):
+    """Writes text to fname, unless it already contains exactly that, so
+    that make doesn't rebuild the objects of untouched files."""
+    if os.path.exists(fname) and open(fname, 'rb').read() == text:
+        return
+    open(fname, 'wb').write(text)
+
 def magic_open(fname):
     # python magic!
-    sys.stdout = open(fname, 'w')
+    magic_close()
+    sys.stdout = StringIO.StringIO()
+    sys.stdout.fname = fname
 
     # print the license
     print('/*')
@@ -374,6 +804,178 @@ def magic_open(fname):
 
     print('/* This file was generated by darmgen.py. Do not edit! */')
 
+def magic_close():
+    """Finishes the file opened by magic_open(), if any, which is written by
+    write_generated()."""
+    if isinstance(sys.stdout, StringIO.StringIO):
+        generated[sys.stdout.fname] = sys.stdout.getvalue()
+        sys.stdout = sys.__stdout__
+
+def write_generated():
+    """Writes the generated files."""
+    for fname, text in generated.items():
+        write_file(fname, text)
+    generated.clear()
+
+generated = collections.OrderedDict()
+
+def canonical(x):
+    """String representation of a part of the instruction tables, which,
+    unlike repr(), includes every attribute of the bit fields."""
+    if isinstance(x, (tuple, list)):
+        return '(%s)' % ', '.join(canonical(y) for y in x)
+    if isinstance(x, dict):
+        return '{%s}' % ', '.join('%s: %s' % (canonical(k), canonical(v))
+                                  for k, v in sorted(x.items()))
+    if isinstance(x, db.Bitsize):
+        return '%s%s' % (x.__class__.__name__, canonical(vars(x)))
+    return repr(x)
+
+class Cache:
+    """Results of the expensive parts of the generation, kept in between
+    runs, along with a hash of their inputs and of the generator itself."""
+    def __init__(self, fname, load=True):
+        self.fname = fname
+        self.entries, self.used = {}, {}
+
+        self.generator = hashlib.sha1()
+        for x in (__file__, db.__file__):
+            self.generator.update(open(x.replace('.pyc', '.py')).read())
+
+        if load and os.path.exists(fname):
+            try:
+                self.entries = cPickle.load(open(fname, 'rb'))
+            except Exception:
+                self.entries = {}
+
+    def get(self, key, inputs, func):
+        """Returns the cached result of func if inputs haven't changed,
+        calls func otherwise."""
+        h = self.generator.copy()
+        h.update(canonical(inputs))
+        digest = h.hexdigest()
+
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != digest:
+            entry = digest, func()
+        self.used[key] = entry
+        return entry[1]
+
+    def save(self):
+        # only keep the entries that are still in use
+        tmp = self.fname + '.tmp'
+        cPickle.dump(self.used, open(tmp, 'wb'), cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, self.fname)
+
+def thumb_full_table(kind, library):
+    """Generates thumb-full-tbl.c, which contains every 16-bit thumb
+    instruction as decoded by library, a build of libdarm without
+    DARM_THUMB_TABLE. kind is either compact, for packed records, or full,
+    for darm_t records and their strings as rendered by darm_str()."""
+    os.environ['DARM_LIBRARY'] = library
+    import darm
+    from ctypes import byref
+
+    # most halfwords don't decode, which libdarm reports on stderr
+    stderr = os.dup(2)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 2)
+
+    rows, strings = [], {}
+    try:
+        for w in range(0x10000):
+            d, s = darm._Darm(), darm._DarmStr()
+
+            # the reason of a failure, so the table can report it as well
+            darm._lib.darm_errors_reset()
+            ret = darm._lib.darm_thumb_disasm(byref(d), w)
+            err = darm._lib.darm_last_error() if ret < 0 else 0
+            if not darm._lib.darm_error_count(err):
+                err = 0
+
+            if darm._lib.darm_str(byref(d), byref(s)) == 0:
+                parts = (s.mnemonic,) + tuple(x.value for x in s.arg) + \
+                    (s.shift, s.instr)
+                idx = [strings.setdefault(x, len(strings)) for x in parts]
+            else:
+                idx = [0xffff] * 7
+            rows.append((w, d, ret, err, idx))
+        darm._lib.darm_errors_reset()
+    finally:
+        os.dup2(stderr, 2)
+        os.close(devnull)
+        os.close(stderr)
+
+    assert len(strings) < 0xffff, 'too many strings for 16-bit indices'
+
+    fields = [x[0] for x in darm._Darm._fields_]
+
+    # halfwords that are rejected upfront only initialize the darm_t
+    init = rows[0xe800][1]
+
+    magic_open('thumb-full-tbl.c')
+    print('#include <stdint.h>')
+    print('#include "darm.h"')
+    print('')
+
+    if kind == 'full':
+        print('const darm_thumb_full_t darm_thumb_table[65536] = {')
+        for w, d, ret, err, idx in rows:
+            values = ['.%s = %d' % (x, getattr(d, x)) for x in fields
+                      if getattr(d, x)]
+            print('    {{%s}, %d, %d},' % (', '.join(values), ret, err))
+        print('};')
+    else:
+        packed = 'instr', 'instr_type', 'cond', 'Rd', 'Rn', 'Rm', 'Rt', \
+            'S', 'I', 'P', 'W', 'reglist', 'imm'
+
+        print('const darm_thumb_packed_t darm_thumb_table[65536] = {')
+        for w, d, ret, err, idx in rows:
+            if w >> 11 in (0b11101, 0b11110, 0b11111):
+                stage = 0
+            else:
+                stage = 2 if d.mode == 1 else 1
+
+            # every other member has to be as initialized, or as implied
+            # by the stage, for the packed form to be complete
+            implied = {'w': w, 'mode': 1, 'size': 2}
+            for x in fields:
+                if x in packed and stage == 2:
+                    continue
+                value = implied.get(x) if stage else None
+                if value is None or stage == 1 and x != 'w':
+                    value = getattr(init, x)
+                assert getattr(d, x) == value, \
+                    'cannot pack %s of 0x%04x' % (x, w)
+
+            imm = d.imm - 2**32 if d.imm >= 2**31 else d.imm
+            assert -2**15 <= imm < 2**15, 'cannot pack imm of 0x%04x' % w
+
+            flags = d.S | (d.I << 2) | (d.P << 4) | (d.W << 6)
+            print('    {%d, %d, %d, %d, %d, %d, %d, %d, %d, %d, %d, %d, %d},'
+                  % (d.instr, d.instr_type, stage, ret, d.cond, d.Rd, d.Rn,
+                     d.Rm, d.Rt, flags, err, d.reglist, imm))
+        print('};')
+
+    # copying the strings is only faster than rendering them if the
+    # darm_t doesn't have to be unpacked in order to validate it
+    if kind != 'full':
+        return
+
+    print('')
+    print('const uint16_t darm_thumb_str_table[65536][7] = {')
+    for w, d, ret, err, idx in rows:
+        print('    {%s},' % ', '.join('%d' % x for x in idx))
+    print('};')
+
+    print('')
+    print('const char *const darm_thumb_strings[] = {')
+    for x in sorted(strings, key=strings.get):
+        print('    "%s",' % x.decode('latin-1').replace('\\', '\\\\')
+              .replace('"', '\\"'))
+    print('};')
+
+
 d = darmtbl
 #d2 = darmtblthumb
 #d3 = darmtblthumb2
@@ -467,7 +1069,7 @@ class FieldGrab_StringConst(FieldGrab):
         self.str = string
 
     def __repr__(self):
-        return '{.type=%s, .str="%s"}' % ('F_STRING_CONST', self.str)
+        return '{.type=%s, .str=%s}' % ('F_STRING_CONST', pooled_string(self.str))
 
 class FieldGrab_ShiftMask(FieldGrab):
     def __init__(self, tup):
@@ -496,12 +1098,19 @@ class FieldGrab_Immediate(FieldGrab_ShiftMask):
 class InstructionLoad:
     def __init__(self, i):
         self.insn = i
+        self.text = None
 
     def __str__(self):
+        # a loader fills every slot of the table its instruction maps to
+        if self.text is None:
+            self.text = self.render()
+        return self.text
+
+    def render(self):
         t = {}
         desc = self.insn[0]
         #t['desc'] = FieldGrab_StringConst(desc)
-        t['format'] = '"' + format_string(desc) + '"'
+        t['format'] = pooled_format([format_string(desc)])
         t['instr'] = 'I_' + instruction_name(desc)
 
         t['dtype'] = 'D_INVLD'
@@ -829,6 +1438,17 @@ def selectInsnGroup(insns, group):
 
 
 if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--thumb-table':
+        thumb_full_table(sys.argv[2], sys.argv[3])
+        magic_close()
+        write_generated()
+        sys.exit(0)
+
+    # the expensive parts are only regenerated if their part of the tables
+    # changed, unless --force is given, and files are only written if their
+    # contents changed
+    cache = Cache('darmgen.cache', load='--force' not in sys.argv[1:])
+
     armv7_table, thumb_table, thumb2_16_table, thumb2_table = {}, {}, {}, {}
 
     # the last item (a list) will contain the instructions affected by this
@@ -881,63 +1501,74 @@ if __name__ == '__main__':
                     break
 
     def fillTable(allDescriptions, table, inslen, bitmask, typenum):
-        sys.stderr.write("\nFilling table\n")
-        for description in allDescriptions:
-            instr = description[0]
-            bits = description[1:]
-            sys.stderr.write("Adding instruction " + instr + " : " + str(bits) + "\n")
-
-            # Verify bitcount
-            bitcount = sum(1 if isinstance(x, int) else x.bitsize for x in bits)
-            assert(bitcount == inslen and "incorrect instruction length")
-            if bitcount != inslen:
-                continue
-
-            allBits = []
-
-            # Stringify the bit-list
-            for x in bits:
-                if isinstance(x, int):
-                    allBits.append(str(x))
-                else:
-                    allBits += ['01'] * x.bitsize
-
-            # Select id bits from bit-list
-            idbits = selectBits(allBits, bitmask)
-
-            # iterate over each possible encoding, expanding '01' entries
-            for enc in itertools.product(*idbits):
-                # use concatenated idbits value as index
-                idx = sum(int(enc[y])*2**(len(idbits)-1-y) for y in range(len(idbits)))
-
-                # find instruction class
-                classEntry = None
-                for entry in instr_types:
-                    if entry[0] != typenum:
-                        continue
-                    if entry[4](bits, enc, allBits):
-                        classEntry = entry
+        # the entries refer to encoding types by their index, so that the
+        # result can be cached
+        def fill():
+            rows, affects = {}, {}
+            types = [(idx, x) for idx, x in enumerate(instr_types)
+                     if x[0] == typenum]
+            for description in allDescriptions:
+                instr = description[0]
+                bits = description[1:]
+                name = instruction_name(instr)
+
+                # Verify bitcount
+                bitcount = sum(1 if isinstance(x, int) else x.bitsize for x in bits)
+                assert(bitcount == inslen and "incorrect instruction length")
+                if bitcount != inslen:
+                    continue
+
+                allBits = []
+
+                # Stringify the bit-list
+                for x in bits:
+                    if isinstance(x, int):
+                        allBits.append(str(x))
+                    else:
+                        allBits += ['01'] * x.bitsize
+
+                # find instruction class, which for thumb and thumb2
+                # depends on the bits of the instruction, but not on the
+                # encoding that is being filled in
+                typeidx = None
+                for idx, entry in types:
+                    if entry[4](bits, None, allBits):
+                        typeidx = idx
                         break
-                if classEntry == None:
-                    sys.stderr.write("Could not find class for instruction " + instruction_name(instr) + ", bits " + str(allBits) + "\n")
-                else:
-                    if idx in table and table[idx][0] != instruction_name(instr):
-                        sys.stderr.write("table collision for " + instruction_name(instr) + " with " + str(table[idx][0]) + "\n")
-                    table[idx] = [instruction_name(instr), entry, format_string(instr)]
-                    entry[-1].append(instr)
-
-
-                #for entry in (_ for _ in instr_types if _[0] == typenum):
-                #    # check if instruction matches class
-                #    if entry[4](bits, enc, allBits):
-                #        if idx in table and table[idx][0] != instruction_name(instr):
-                #            sys.stderr.write("table collision for " + instruction_name(instr) + " with " + str(table[idx][0]) + "\n")
-                #        table[idx] = [instruction_name(instr), entry, format_string(instr)]
-                #        inserted = True
-                #        # add instruction to list in type
-                #        entry[-1].append(instr)
-                #        break
-                #if not inserted:
+                if typeidx == None:
+                    sys.stderr.write("Could not find class for instruction " + name + ", bits " + str(allBits) + "\n")
+                    continue
+
+                # Select id bits from bit-list, the fixed bits make up the
+                # base index, every subset of the wildcard bits is added
+                # to it
+                idbits = selectBits(allBits, bitmask)
+                fixed = int(''.join('1' if x == '1' else '0' for x in idbits) or '0', 2)
+                wildcard = int(''.join('1' if x == '01' else '0' for x in idbits) or '0', 2)
+
+                row = [name, typeidx, format_string(instr)]
+                collisions = set()
+                subset = wildcard
+                while True:
+                    idx = fixed | subset
+                    if idx in rows and rows[idx][0] != name:
+                        collisions.add(rows[idx][0])
+                    rows[idx] = row
+                    if subset == 0:
+                        break
+                    subset = (subset - 1) & wildcard
+
+                for x in sorted(collisions):
+                    sys.stderr.write("table collision for " + name + " with " + x + "\n")
+                affects.setdefault(typeidx, set()).add(instr)
+            return rows, affects
+
+        rows, affects = cache.get('fill_%d' % typenum,
+                                  (allDescriptions, inslen, bitmask), fill)
+        for idx, (name, typeidx, fmt) in rows.items():
+            table[idx] = [name, instr_types[typeidx], fmt]
+        for typeidx, instrs in affects.items():
+            instr_types[typeidx][-1].extend(instrs)
 
     fillTable(darmtblthumb.thumbs, thumb_table, 16, thumb_lookup_bitMask, 2)
     fillTable(darmtblthumb2.thumb16, thumb2_16_table, 16, thumb2_16_lookup_bitMask, 3)
@@ -968,13 +1599,19 @@ if __name__ == '__main__':
     # print all instruction labels
     print(instruction_names_enum(open('instructions.txt')))
     count = len(instruction_names(open('instructions.txt')))
-    print('extern const char *darm_mnemonics[%d];' % count)
-    print('extern const char *darm_enctypes[%d];' % len(instr_types))
-    print('extern const char *darm_registers[16];')
-    print('extern const char *darm_F32_registers[32];')
-    print('extern const char *darm_F64_registers[32];')
-    print('extern const char *darm_F128_registers[16];')
-    print('extern const char *darm_datatypes[%d];' % (len(dtypes) + 1))
+
+    # the string tables hold offsets in darm_strings, see darm_string()
+    print('#define DARM_STRING(offset, str) offset')
+    print('extern const char darm_strings[];')
+    print('#define DARM_FORMAT(offset, str) offset')
+    print('extern const uint8_t darm_formats[];')
+    print('extern const uint16_t darm_mnemonics[%d];' % count)
+    print('extern const uint16_t darm_enctypes[%d];' % len(instr_types))
+    print('extern const uint16_t darm_registers[16];')
+    print('extern const uint16_t darm_F32_registers[32];')
+    print('extern const uint16_t darm_F64_registers[32];')
+    print('extern const uint16_t darm_F128_registers[16];')
+    print('extern const uint16_t darm_datatypes[%d];' % (len(dtypes) + 1))
 
     # define constants 0b0 up upto 0b11111111
     for x in range(256):
@@ -986,10 +1623,17 @@ if __name__ == '__main__':
             num = ''.join(y)
             print('#define b%s %d' % (num, int(num, 2)))
 
+    # nodes of the decision trees, which replace the flat lookup tables in
+    # a build with DARM_LOOKUP_TREE defined, see darm_tree_lookup()
+    print('#define DARM_TREE_LEAF 0x8000')
+    print(struct_definition('darm_tree_node_t',\
+                                [['bit', 'uint16_t'],\
+                                 ['next[2]', 'uint16_t']]))
+
     print(struct_definition('darm_lookup_t',\
                                 [['instr', 'uint32_t'],\
                                  ['instr_type', 'uint32_t'],\
-                                 ['format', 'char*']]))
+                                 ['format', 'uint16_t']]))
 
     print(enum_table('darm_field', ['F_%s' % (i)\
                      for i in ['INVLD', 'SHIFT_MASK', 'STRING_CONST', 'IMMEDIATE']]))
@@ -1004,9 +1648,36 @@ if __name__ == '__main__':
                                  ['q%s' % str(i) for i in range(16)] +
                                  ['R_INVLD = -1']))
 
+    # with DARM_PACKED_LOADERS defined the fieldloaders take a fraction of
+    # the space
+    print('#ifdef DARM_PACKED_LOADERS')
+    print(struct_definition('darm_fieldgrab_t',\
+                                [['type', 'uint8_t'],\
+                                 ['shift', 'uint8_t'],\
+                                 ['mask', 'uint8_t'],\
+                                 ['extend', 'uint8_t'],\
+                                 ['mult', 'int8_t'],\
+                                 ['str', 'uint16_t']]))
+
+    print(struct_definition('darm_fieldloader_t',\
+                                [['instr', 'uint16_t'],\
+                                 ['format', 'uint16_t'],\
+                                 ['dtype', 'uint8_t'],\
+                                 ['stype', 'uint8_t'],\
+                                 ['imm', 'darm_fieldgrab_t'],\
+                                 ['cond', 'darm_fieldgrab_t'],\
+                                 ['Rm', 'darm_fieldgrab_t'],\
+                                 ['Rd', 'darm_fieldgrab_t'],\
+                                 ['Rn', 'darm_fieldgrab_t'],\
+                                 ['RmBase', 'int8_t'],\
+                                 ['RdBase', 'int8_t'],\
+                                 ['RnBase', 'int8_t']\
+                                ]))
+    print('#else')
+
     print(struct_definition('darm_fieldgrab_t',\
                                 [['type', 'darm_field_t'],\
-                                 ['str', 'const char*'],\
+                                 ['str', 'uint16_t'],\
                                  ['shift', 'uint32_t'],\
                                  ['mask', 'uint32_t'],\
                                  ['extend', 'uint32_t'],\
@@ -1014,7 +1685,7 @@ if __name__ == '__main__':
 
     print(struct_definition('darm_fieldloader_t',\
                                 [['instr', 'darm_instr_t'],\
-                                 ['format', 'const char*'],\
+                                 ['format', 'uint16_t'],\
                                  ['dtype', 'darm_datatype_t'],\
                                  ['stype', 'darm_datatype_t'],\
                                  ['imm', 'darm_fieldgrab_t'],\
@@ -1026,9 +1697,21 @@ if __name__ == '__main__':
                                  ['RdBase', 'darm_reg_t'],\
                                  ['RnBase', 'darm_reg_t']\
                                 ]))
+    print('#endif')
 
     print('#endif')
 
+    lookups = (thumb_table, thumb_lookup_bits, 'thumb'), \
+        (thumb2_16_table, thumb2_16_lookup_bits, 'thumb2_16'), \
+        (thumb2_table, thumb2_lookup_bits, 'thumb2')
+
+    # the two-level tables are declared in thumb-tbl.h
+    paged = {}
+    for table, bits, kind in lookups:
+        values = [instruction_lookup_entry(table, k) for k in range(2**bits)]
+        paged[kind] = cache.get('paged_' + kind, values, lambda: paged_table(
+            'darm_lookup_t', kind + '_instr', values, bits))
+
     #
     # thumb-tbl.h
     #
@@ -1042,10 +1725,19 @@ if __name__ == '__main__':
     print('#include "darm-tbl.h"')
 
     # print some required definitions
-    print('extern const char *thumb_registers[9];')
+    print('extern const uint16_t thumb_registers[9];')
+    print('#if defined(DARM_LOOKUP_TREE)')
+    for kind in 'thumb', 'thumb2_16', 'thumb2':
+        print('extern darm_lookup_t %s_instr_leaves[];' % kind)
+        print('extern const darm_tree_node_t %s_instr_tree[];' % kind)
+    print('#elif defined(DARM_LOOKUP_PAGED)')
+    for table, bits, kind in lookups:
+        sys.stdout.write(paged[kind][0])
+    print('#else')
     print('extern darm_lookup_t thumb_instr_lookup[%d];' % (2**thumb_lookup_bits))
     print('extern darm_lookup_t thumb2_16_instr_lookup[%d];' % (2**thumb2_16_lookup_bits))
     print('extern darm_lookup_t thumb2_instr_lookup[%d];' % (2**thumb2_lookup_bits))
+    print('#endif')
 
     print('#endif')
 
@@ -1081,7 +1773,7 @@ if __name__ == '__main__':
     type_lut('sync', 4)
     type_lut('pusr', 4)
 
-    print('extern const char *armv7_format_strings[%d][3];' % instrcnt)
+    print('extern const uint16_t armv7_formats[%d];' % instrcnt)
     print('#endif')
 
     #
@@ -1122,9 +1814,18 @@ if __name__ == '__main__':
     print(string_table('thumb_registers', reg.split()))
 
     # single structure for all lookups
-    print(instruction_lookup_table(thumb_table, thumb_lookup_bits, 'thumb'))
-    print(instruction_lookup_table(thumb2_16_table, thumb2_16_lookup_bits, 'thumb2_16'))
-    print(instruction_lookup_table(thumb2_table, thumb2_lookup_bits, 'thumb2'))
+    print('#if defined(DARM_LOOKUP_TREE)')
+    for table, bits, kind in lookups:
+        values = [instruction_lookup_entry(table, k) for k in range(2**bits)]
+        print(cache.get('tree_' + kind, values, lambda: decision_tree_table(
+            'darm_lookup_t', kind + '_instr', values, bits)))
+    print('#elif defined(DARM_LOOKUP_PAGED)')
+    for table, bits, kind in lookups:
+        print(paged[kind][1])
+    print('#else')
+    for table, bits, kind in lookups:
+        print(instruction_lookup_table(table, bits, kind))
+    print('#endif')
 
 
     #
@@ -1263,11 +1964,12 @@ if __name__ == '__main__':
 
     lines = []
     for instr, fmtstr in fmtstrs.items():
-        fmtstr = ', '.join('"%s"' % x for x in set(fmtstr))
-        lines.append('    [I_%s] = {%s},' % (instr, fmtstr))
-    print('const char *armv7_format_strings[%d][3] = {' % instrcnt)
+        fmtstr = pooled_format(list(set(fmtstr)), strict=True)
+        lines.append('    [I_%s] = %s,' % (instr, fmtstr))
+    print('const uint16_t armv7_formats[%d] = {' % instrcnt)
     print('\n'.join(sorted(lines)))
     print('};')
+    magic_close()
 
     ## Write neon and vfp tables ext-tbl.h ext-tbl.c
 
@@ -1309,31 +2011,62 @@ if __name__ == '__main__':
 
         return "(" + " | ".join(runs) + ")"
 
-    lookups = open('darm-lookups.h', 'w')
+    lookups = StringIO.StringIO()
     lookups.write('#ifndef __DARM_LOOKUPS__\n')
     lookups.write('#define __DARM_LOOKUPS__\n')
 
     def addTable(descriptions, group, name, header, src):
         insns = selectInsnGroup(descriptions, group)
-        mask = generate_mask(insns, 32)
-        lookups.write("// " + name + " 0b" + mask + "\n")
-        lookups.write("#define " + name.upper() + "(__v) " + createBitMacro(mask) + "\n")
-        lookups.write("#define " + name.upper() + "_LOOKUP(__v) (" + name + "_lookup[" + name.upper() + "(__v)])\n")
-
-        table = create_table(insns, mask)
-
-        header.write('extern darm_fieldloader_t ' + name + '_lookup[%d];\n' % (2**mask.count('1')))
-        src.write('darm_fieldloader_t ' + name + '_lookup[%d] = {' % (2**mask.count('1')))
-        for i in range(len(table)):
-            if table[i] == None:
-                src.write('_EMPTY_LDR,/* %d */\n' % (i))
-            else:
-                src.write(repr(table[i]) + ',/* %d */\n' % (i))
-        src.write('};\n')
-
 
-    header = open('ext-tbl.h', 'w')
-    src    = open('ext-tbl.c', 'w')
+        # rendering the loaders takes the majority of the time, so the
+        # generated code is cached per table
+        def generate():
+            lookups, header, src = [StringIO.StringIO() for _ in range(3)]
+
+            mask = generate_mask(insns, 32)
+            lookups.write("// " + name + " 0b" + mask + "\n")
+            lookups.write("#define " + name.upper() + "(__v) " + createBitMacro(mask) + "\n")
+            lookups.write("#if defined(DARM_LOOKUP_TREE)\n")
+            lookups.write("#define " + name.upper() + "_LOOKUP(__v) (" + name + "_leaves[darm_tree_lookup(" + name + "_tree, " + name.upper() + "(__v))])\n")
+            lookups.write("#elif defined(DARM_LOOKUP_PAGED)\n")
+            lookups.write("#define " + name.upper() + "_LOOKUP(__v) DARM_PAGED_LOOKUP(" + name + ", " + name.upper() + "(__v))\n")
+            lookups.write("#else\n")
+            lookups.write("#define " + name.upper() + "_LOOKUP(__v) (" + name + "_lookup[" + name.upper() + "(__v)])\n")
+            lookups.write("#endif\n")
+
+            table = create_table(insns, mask)
+            values = ['_EMPTY_LDR' if x == None else repr(x) for x in table]
+
+            paged = paged_table('darm_fieldloader_t', name, values, mask.count('1'))
+
+            header.write('#if defined(DARM_LOOKUP_TREE)\n')
+            header.write('extern darm_fieldloader_t ' + name + '_leaves[];\n')
+            header.write('extern const darm_tree_node_t ' + name + '_tree[];\n')
+            header.write('#elif defined(DARM_LOOKUP_PAGED)\n')
+            header.write(paged[0])
+            header.write('#else\n')
+            header.write('extern darm_fieldloader_t ' + name + '_lookup[%d];\n' % (2**mask.count('1')))
+            header.write('#endif\n')
+
+            src.write('#if defined(DARM_LOOKUP_TREE)\n')
+            src.write(decision_tree_table('darm_fieldloader_t', name, values, mask.count('1')))
+            src.write('#elif defined(DARM_LOOKUP_PAGED)\n')
+            src.write(paged[1])
+            src.write('#else\n')
+            src.write('darm_fieldloader_t ' + name + '_lookup[%d] = {' % (2**mask.count('1')))
+            for i in range(len(table)):
+                src.write(values[i] + ',/* %d */\n' % (i))
+            src.write('};\n')
+            src.write('#endif\n')
+            return lookups.getvalue(), header.getvalue(), src.getvalue()
+
+        texts = cache.get(name, insns, generate)
+        for f, text in zip((lookups, header, src), texts):
+            f.write(text)
+
+
+    header = StringIO.StringIO()
+    src    = StringIO.StringIO()
 
     header.write('#ifndef __DARM_EXT_TBL__\n')
     header.write('#define __DARM_EXT_TBL__\n')
@@ -1359,7 +2092,29 @@ if __name__ == '__main__':
     header.write('\n#endif\n')
     lookups.write('\n#endif\n')
 
-    header.close()
-    src.close()
-    lookups.close()
+    generated['ext-tbl.h'] = header.getvalue()
+    generated['ext-tbl.c'] = src.getvalue()
+    generated['darm-lookups.h'] = lookups.getvalue()
+
+    # the python bindings mirror the structures of darm.h, which libdarm
+    # reports the layout of in darm_layout, see darm_ctypes.check()
+    header = open('darm.h').read()
+    errors = re.search(r'enum _darm_error_t {(.*?)}', header, re.S).group(1)
+    structs = c_structures(header, ctypes_structures, {
+        'ARRAYSIZE(darm_enctypes)': len(instr_types),
+        'I_INSTRCNT': len(instruction_names(open('instructions.txt'))),
+        'E_ERRCNT': re.findall(r'^\s*(E_\w+)', errors, re.M).index('E_ERRCNT'),
+    })
+    enums = enum_signedness(header + generated['darm-tbl.h'])
+    generated['darm_ctypes.py'] = ctypes_module(structs, enums)
+
+    magic_open('darm-layout.c')
+    sys.stdout.write(layout_source(structs))
+    magic_close()
+
+    FormatPool().resolve(generated)
+    StringPool().resolve(generated)
+    write_generated()
+
+    cache.save()
 
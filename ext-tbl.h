@@ -2,13 +2,85 @@
 #define __DARM_EXT_TBL__
 #include <stdint.h>
 #include "darm-tbl.h"
+#if defined(DARM_LOOKUP_TREE)
+extern darm_fieldloader_t thumb_vfp_ldst_leaves[];
+extern const darm_tree_node_t thumb_vfp_ldst_tree[];
+#elif defined(DARM_LOOKUP_PAGED)
+extern darm_fieldloader_t thumb_vfp_ldst_leaves[21];
+extern const uint8_t thumb_vfp_ldst_blocks[6][4];
+extern const uint8_t thumb_vfp_ldst_pages[8];
+#else
 extern darm_fieldloader_t thumb_vfp_ldst_lookup[32];
+#endif
+#if defined(DARM_LOOKUP_TREE)
+extern darm_fieldloader_t thumb_vfp_dpi_leaves[];
+extern const darm_tree_node_t thumb_vfp_dpi_tree[];
+#elif defined(DARM_LOOKUP_PAGED)
+extern darm_fieldloader_t thumb_vfp_dpi_leaves[79];
+extern const uint8_t thumb_vfp_dpi_blocks[22][8];
+extern const uint8_t thumb_vfp_dpi_pages[128];
+#else
 extern darm_fieldloader_t thumb_vfp_dpi_lookup[1024];
+#endif
+#if defined(DARM_LOOKUP_TREE)
+extern darm_fieldloader_t thumb_neon_ldst_leaves[];
+extern const darm_tree_node_t thumb_neon_ldst_tree[];
+#elif defined(DARM_LOOKUP_PAGED)
+extern darm_fieldloader_t thumb_neon_ldst_leaves[81];
+extern const uint8_t thumb_neon_ldst_blocks[15][16];
+extern const uint8_t thumb_neon_ldst_pages[32];
+#else
 extern darm_fieldloader_t thumb_neon_ldst_lookup[512];
+#endif
+#if defined(DARM_LOOKUP_TREE)
+extern darm_fieldloader_t thumb_neon_dpi_leaves[];
+extern const darm_tree_node_t thumb_neon_dpi_tree[];
+#elif defined(DARM_LOOKUP_PAGED)
+extern darm_fieldloader_t thumb_neon_dpi_leaves[27];
+extern const uint8_t thumb_neon_dpi_blocks[12][4];
+extern const uint8_t thumb_neon_dpi_pages[32];
+#else
 extern darm_fieldloader_t thumb_neon_dpi_lookup[128];
+#endif
+#if defined(DARM_LOOKUP_TREE)
+extern darm_fieldloader_t arm_vfp_ldst_leaves[];
+extern const darm_tree_node_t arm_vfp_ldst_tree[];
+#elif defined(DARM_LOOKUP_PAGED)
+extern darm_fieldloader_t arm_vfp_ldst_leaves[23];
+extern const uint8_t arm_vfp_ldst_blocks[1][32];
+extern const uint8_t arm_vfp_ldst_pages[1];
+#else
 extern darm_fieldloader_t arm_vfp_ldst_lookup[32];
+#endif
+#if defined(DARM_LOOKUP_TREE)
+extern darm_fieldloader_t arm_vfp_dpi_leaves[];
+extern const darm_tree_node_t arm_vfp_dpi_tree[];
+#elif defined(DARM_LOOKUP_PAGED)
+extern darm_fieldloader_t arm_vfp_dpi_leaves[79];
+extern const uint8_t arm_vfp_dpi_blocks[22][8];
+extern const uint8_t arm_vfp_dpi_pages[128];
+#else
 extern darm_fieldloader_t arm_vfp_dpi_lookup[1024];
+#endif
+#if defined(DARM_LOOKUP_TREE)
+extern darm_fieldloader_t arm_neon_ldst_leaves[];
+extern const darm_tree_node_t arm_neon_ldst_tree[];
+#elif defined(DARM_LOOKUP_PAGED)
+extern darm_fieldloader_t arm_neon_ldst_leaves[263];
+extern const uint16_t arm_neon_ldst_blocks[88][8];
+extern const uint8_t arm_neon_ldst_pages[256];
+#else
 extern darm_fieldloader_t arm_neon_ldst_lookup[2048];
+#endif
+#if defined(DARM_LOOKUP_TREE)
+extern darm_fieldloader_t arm_neon_dpi_leaves[];
+extern const darm_tree_node_t arm_neon_dpi_tree[];
+#elif defined(DARM_LOOKUP_PAGED)
+extern darm_fieldloader_t arm_neon_dpi_leaves[648];
+extern const uint16_t arm_neon_dpi_blocks[78][32];
+extern const uint8_t arm_neon_dpi_pages[1024];
+#else
 extern darm_fieldloader_t arm_neon_dpi_lookup[32768];
+#endif
 
 #endif
@@ -0,0 +1,218 @@
+"""
+Copyright (c) 2013, Jurriaan Bremer
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+* Neither the name of the darm developer(s) nor the names of its
+  contributors may be used to endorse or promote products derived from this
+  software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+"""
+import io
+import itertools
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.environ.setdefault('DARM_LIBRARY', os.path.join(root, 'libdarm.so'))
+
+import darm
+
+
+class TestBatches(unittest.TestCase):
+    def setUp(self):
+        darm.set_quiet()
+
+        # more instructions than are decoded by a single native call
+        self.count = darm._BATCH + 0x100
+        self.buf = struct.pack('<I', 0xe5921004) * self.count
+
+    def tearDown(self):
+        darm.set_quiet(False)
+
+    def assertDetached(self, d):
+        # a Darm owning its own structure doesn't keep its batch alive
+        self.assertIsNone(d.d._b_base_)
+        self.assertIsNone(d.d._objects)
+
+    def test_iter_disasm(self):
+        kept = [d for addr, d in darm.iter_disasm(io.BytesIO(self.buf))
+                if addr % 0x4000 == 0]
+        self.assertEqual(len(kept), self.count * 4 // 0x4000 + 1)
+        for d in kept:
+            self.assertDetached(d)
+            self.assertEqual(str(d), 'ldr r1, [r2, #0x4]')
+
+    def test_disasm_buffer(self):
+        rows = darm.disasm_buffer(self.buf)
+        self.assertEqual(len(rows), self.count)
+        self.assertEqual(rows[-1][0], (self.count - 1) * 4)
+        self.assertDetached(rows[-1][1])
+
+    def test_thumb_buffer(self):
+        # movs r0, #1 followed by a thumb2 ldr.w r1, [r2, #4], which only
+        # gets as many structures as it has instructions
+        buf = struct.pack('<HHH', 0x2001, 0xf8d2, 0x1004) * self.count
+        rows = darm.disasm_buffer(buf, 'thumb')
+        self.assertEqual(len(rows), 2 * self.count)
+        self.assertEqual(len(rows._arr), 2 * self.count)
+        self.assertEqual(rows[-1][0], len(buf) - 4)
+        self.assertEqual(rows._end(), len(buf))
+
+    def test_partial(self):
+        # three bytes of another ldr, and the first halfword of a thumb2
+        # ldr.w after a movs, are too few for an instruction
+        ldr = 'ldr r1, [r2, #0x4]'
+        for mode, buf, expected in (
+                ('arm', self.buf[:15],
+                 [(0, ldr), (4, ldr), (8, ldr), (12, None)]),
+                ('thumb', struct.pack('<HH', 0x2001, 0xf8d2),
+                 [(0, 'movs r0, #1'), (2, None)])):
+            fd, path = tempfile.mkstemp()
+            try:
+                os.write(fd, buf)
+                os.close(fd)
+
+                results = [darm.disasm_buffer(buf, mode),
+                           darm.iter_disasm(io.BytesIO(buf), mode,
+                                            chunk_size=5),
+                           darm.disasm_file(path, mode=mode)]
+                if darm.shared_memory is not None:
+                    results.append(itertools.chain.from_iterable(
+                        darm.parallel_disasm(path, mode, workers=2,
+                                             shard_size=4)))
+
+                for result in results:
+                    self.assertEqual([(addr, d and str(d))
+                                      for addr, d in result], expected)
+            finally:
+                os.unlink(path)
+
+    @unittest.skipIf(darm.shared_memory is None, 'requires shared memory')
+    def test_parallel_disasm(self):
+        # add r0, r0, #idx
+        words = [0xe2800000 + idx for idx in range(0x4000)]
+
+        fd, path = tempfile.mkstemp()
+        try:
+            os.write(fd, struct.pack('<%dI' % len(words), *words))
+            os.close(fd)
+
+            # the shards are views on shared memory blocks that are reused,
+            # which have to be copied out of them when they're kept around
+            shards = list(darm.parallel_disasm(path, workers=2,
+                                               shard_size=0x1000))
+            self.assertEqual(
+                [(addr, str(d)) for addr, d in
+                 itertools.chain.from_iterable(shards)],
+                [(addr, str(d)) for addr, d in darm.disasm_file(path)])
+        finally:
+            os.unlink(path)
+
+
+class TestErrors(unittest.TestCase):
+    def setUp(self):
+        darm.set_quiet()
+        darm.reset_errors()
+
+    def tearDown(self):
+        darm.set_quiet(False)
+        darm.reset_errors()
+
+    def test_thumb_sweep(self):
+        # the same for every build, i.e., with and without the thumb table
+        for w in range(0x10000):
+            darm.disasm_thumb(w)
+        self.assertEqual(darm.errors(),
+                         {'LOOKUP': 2816, 'UNHANDLED': 6144, 'OPERAND': 256})
+
+        self.assertIsNone(darm.disasm_thumb(0xe800))
+        self.assertEqual(darm.last_error(), 'UNHANDLED')
+
+    def test_cache(self):
+        # words that fail, some of them more than once
+        words = [0xffffffff] * 1000 + list(range(0xf7f0fff0, 0xf7f10000))
+        buf = struct.pack('<%dI' % len(words), *words) * 2
+
+        list(darm.disasm_buffer(buf))
+        expected = darm.errors()
+        self.assertEqual(expected['UNHANDLED'] % 2000, 0)
+
+        darm.reset_errors()
+        darm.set_cache()
+        try:
+            list(darm.disasm_buffer(buf))
+            self.assertGreater(darm.cache_info()['native_hits'], 2000)
+        finally:
+            darm.set_cache(None)
+        self.assertEqual(darm.errors(), expected)
+
+
+class TestCache(unittest.TestCase):
+    def test_size(self):
+        buf = struct.pack('<II', 0xe5921004, 0xe5921004)
+        entries = (darm._DarmCacheEntry * 4)()
+        for size in (0, 3, 4):
+            cache = darm._DarmCache()
+            ret = darm._lib.darm_cache_init(darm.byref(cache), entries, size)
+            self.assertEqual(ret, 0 if size == 4 else -1)
+
+            arr = (darm._Darm * 2)()
+            count = darm._lib.darm_disasm_buffer_cached(
+                arr, 2, buf, len(buf), darm._modes['arm'], darm.byref(cache))
+            self.assertEqual(count, 2)
+            self.assertEqual(cache.hits, 1 if size == 4 else 0)
+            self.assertEqual(arr[1].instr, arr[0].instr)
+
+
+class TestOperands(unittest.TestCase):
+    def memory_operand(self, w):
+        return darm.disasm(w).operands[1]
+
+    def test_offset(self):
+        # ldr r1, [r2, #0x4]
+        self.assertEqual(self.memory_operand(0xe5921004),
+                         darm.Mem(darm.Register(2), 4, None, False))
+
+    def test_pre_indexed(self):
+        # ldr r1, [r2, #0x4]!
+        self.assertEqual(self.memory_operand(0xe5b21004),
+                         darm.Mem(darm.Register(2), 4, None, True))
+
+    def test_post_indexed(self):
+        # ldr r1, [r2], #0x4
+        self.assertEqual(darm.disasm(0xe4921004).operands[1:],
+                         (darm.Mem(darm.Register(2), None, None, True),
+                          darm.Imm(4)))
+
+    def test_post_indexed_register(self):
+        # ldr r1, [r2], -r3
+        self.assertEqual(darm.disasm(0xe6121003).operands[1:],
+                         (darm.Mem(darm.Register(2), None, None, True),
+                          darm.Reg(darm.Register(3), True, False)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -370,14 +370,94 @@ static int _darm_thumb2_disasm(darm_t *d, uint32_t w)
     return darm_thumb2_disasm(d, w & 0xffff, 0x0000);
 }
 
+static int (*disasms[])(darm_t *d, uint32_t w) = {
+    &darm_armv7_disasm, &_darm_thumb_disasm, &_darm_thumb2_disasm,
+};
+
+// there's an operand for every argument and for the shift of every test,
+// which is checked for all of the tests before their encodings are
+static void test_operands()
+{
+    int disasm_index = 0, failure = 0;
+
+    // the failures are reported by the encoding tests
+    darm_set_quiet(1);
+
+    for (uint32_t i = 0; i < ARRAYSIZE(tests); i++) {
+        darm_t d; darm_str_t str; darm_operand_t ops[DARM_MAX_OPERANDS];
+
+        if(tests[i].w == 0) {
+            disasm_index++;
+            continue;
+        }
+
+        disasms[disasm_index](&d, tests[i].w);
+
+        memset(&str, 0, sizeof(str));
+        if(darm_str2(&d, &str, 1) == 0) {
+            int count = 0;
+            while (count < 4 && str.arg[count][0] != 0) count++;
+            if(darm_operands(&d, ops) != count + (str.shift[0] != 0)) {
+                printf("incorrect operands for 0x%08x\n", d.w);
+                failure = 1;
+            }
+        }
+    }
+
+    darm_set_quiet(0);
+    if(failure != 0) {
+        exit(1);
+    }
+}
+
+// the memory operand of a load in each of its addressing modes
+struct {
+    uint32_t w;
+    uint32_t operand;
+    darm_reg_t index;
+    uint32_t imm;
+    uint32_t writeback;
+} memory_tests[] = {
+    // ldr r1, [r2, #0x4]
+    {0xe5921004, 1, R_INVLD, 4, 0},
+    // ldr r1, [r2, #0x4]!
+    {0xe5b21004, 1, R_INVLD, 4, 1},
+    // ldr r1, [r2], #0x4
+    {0xe4921004, 1, R_INVLD, 0, 1},
+    // ldr r1, [r2, r3]
+    {0xe7921003, 1, r3, 0, 0},
+    // ldr r1, [r2, r3]!
+    {0xe7b21003, 1, r3, 0, 1},
+    // ldr r1, [r2], r3
+    {0xe6921003, 1, R_INVLD, 0, 1},
+};
+
+static void test_memory_operands()
+{
+    for (uint32_t i = 0; i < ARRAYSIZE(memory_tests); i++) {
+        darm_t d; darm_operand_t ops[DARM_MAX_OPERANDS];
+        darm_operand_t *op = &ops[memory_tests[i].operand];
+
+        if(darm_armv7_disasm(&d, memory_tests[i].w) < 0 ||
+                darm_operands(&d, ops) < 0 || op->type != OP_MEM ||
+                op->reg != r2 || op->index != memory_tests[i].index ||
+                op->imm != memory_tests[i].imm ||
+                op->writeback != memory_tests[i].writeback) {
+            printf("incorrect memory operand for 0x%08x\n",
+                memory_tests[i].w);
+            exit(1);
+        }
+    }
+}
+
 int main()
 {
     int failure = 0;
 
+    test_operands();
+    test_memory_operands();
+
     int disasm_index = 0;
-    int (*disasms[])(darm_t *d, uint32_t w) = {
-        &darm_armv7_disasm, &_darm_thumb_disasm, &_darm_thumb2_disasm,
-    };
 
     for (uint32_t i = 0; i < ARRAYSIZE(tests); i++) {
         darm_t d; int ret;
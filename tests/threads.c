@@ -0,0 +1,140 @@
+#include <stdio.h>
+#include <string.h>
+#include <stdlib.h>
+#include <pthread.h>
+#include "../darm.h"
+
+// decodes the same instructions in multiple threads at the same time and
+// checks that every thread gets exactly the same results as a single thread
+
+#define THREADS 8
+#define ROUNDS 4
+#define COUNT 0x10000
+
+static uint8_t g_buf[COUNT * 4];
+
+struct result {
+    darm_t d;
+    int ret;
+    char str[64];
+};
+
+static struct result g_ref[3][COUNT];
+
+// the amount of failures of each reason reported while decoding g_ref
+static uint8_t g_ref_errors[3][COUNT][E_ERRCNT];
+
+static int decode(int mode, uint32_t idx, struct result *r)
+{
+    const uint8_t *p = &g_buf[idx * 4];
+    uint32_t w = p[0] | (p[1] << 8) | (p[2] << 16) | ((uint32_t) p[3] << 24);
+    darm_str_t str;
+
+    memset(r, 0, sizeof(*r));
+    switch (mode) {
+    case 0:
+        r->ret = darm_armv7_disasm(&r->d, w);
+        break;
+
+    case 1:
+        r->ret = darm_thumb_disasm(&r->d, w & 0xffff);
+        break;
+
+    case 2:
+        r->ret = darm_thumb2_disasm_bytes(&r->d, p, 4);
+        break;
+    }
+
+    if(darm_str2(&r->d, &str, idx & 1) == 0) {
+        strcpy(r->str, str.instr);
+    }
+    return 0;
+}
+
+static void *worker(void *arg)
+{
+    uintptr_t failures = 0, start = (uintptr_t) arg;
+    struct result r;
+
+    for (uint32_t round = 0; round < ROUNDS; round++) {
+        for (uint32_t i = 0; i < COUNT; i++) {
+            // every thread walks the instructions in a different order
+            uint32_t idx = (i + start * COUNT / THREADS) % COUNT;
+            int mode = (idx + round + start) % 3;
+
+            decode(mode, idx, &r);
+            if(memcmp(&r, &g_ref[mode][idx], sizeof(r)) != 0) {
+                failures++;
+            }
+        }
+    }
+    return (void *) failures;
+}
+
+int main()
+{
+    pthread_t threads[THREADS];
+    uint32_t seed = 0x12345678;
+    uintptr_t failures = 0;
+
+    // the failures are checked through darm_error_count() instead
+    darm_set_quiet(1);
+
+    for (uint32_t i = 0; i < sizeof(g_buf); i++) {
+        seed = seed * 1103515245 + 12345;
+        g_buf[i] = seed >> 16;
+    }
+
+    for (int mode = 0; mode < 3; mode++) {
+        for (uint32_t i = 0; i < COUNT; i++) {
+            darm_errors_reset();
+            decode(mode, i, &g_ref[mode][i]);
+            for (int err = E_NONE; err < E_ERRCNT; err++) {
+                g_ref_errors[mode][i][err] = darm_error_count(err);
+            }
+        }
+    }
+    darm_errors_reset();
+
+    for (uintptr_t i = 0; i < THREADS; i++) {
+        if(pthread_create(&threads[i], NULL, &worker, (void *) i) != 0) {
+            printf("error creating thread..\n");
+            return 1;
+        }
+    }
+
+    for (uint32_t i = 0; i < THREADS; i++) {
+        void *ret;
+        pthread_join(threads[i], &ret);
+        failures += (uintptr_t) ret;
+    }
+
+    if(failures != 0) {
+        printf("%d instructions decoded differently by threads\n",
+            (int) failures);
+        return 1;
+    }
+
+    // every failure of every thread has to be counted exactly once
+    for (int err = E_NONE; err < E_ERRCNT; err++) {
+        uint64_t expected = 0;
+        for (uint32_t start = 0; start < THREADS; start++) {
+            for (uint32_t round = 0; round < ROUNDS; round++) {
+                for (uint32_t idx = 0; idx < COUNT; idx++) {
+                    int mode = (idx + round + start) % 3;
+                    expected += g_ref_errors[mode][idx][err];
+                }
+            }
+        }
+
+        if(darm_error_count(err) != expected) {
+            printf("%s failures counted %d times instead of %d\n",
+                darm_error_name(err), (int) darm_error_count(err),
+                (int) expected);
+            return 1;
+        }
+    }
+
+    printf("[x] thread tests were successful\n");
+    return 0;
+}
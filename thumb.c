@@ -33,6 +33,87 @@ POSSIBILITY OF SUCH DAMAGE.
 #include "darm.h"
 #include "thumb-tbl.h"
 
+#ifdef DARM_THUMB_TABLE
+
+#if DARM_THUMB_TABLE == DARM_THUMB_TABLE_FULL
+extern const darm_thumb_full_t darm_thumb_table[65536];
+
+// indices into darm_thumb_strings for the mnemonic, the four arguments, the
+// shift and the entire instruction, or 0xffff if darm_str() fails
+extern const uint16_t darm_thumb_str_table[65536][7];
+extern const char *const darm_thumb_strings[];
+#else
+extern const darm_thumb_packed_t darm_thumb_table[65536];
+#endif
+
+// report the failure the table was generated with, as the decoder would
+static int thumb_failure(uint16_t w, int ret, darm_error_t err)
+{
+    if(ret < 0 && err != E_NONE) {
+        DARM_ERROR(err, "darm_thumb_disasm: %s error for 0x%04x\n",
+            darm_error_name(err), w);
+    }
+    return ret;
+}
+
+int darm_thumb_decode(darm_t *d, uint16_t w)
+{
+#if DARM_THUMB_TABLE == DARM_THUMB_TABLE_FULL
+    *d = darm_thumb_table[w].d;
+    return thumb_failure(w, darm_thumb_table[w].ret,
+        darm_thumb_table[w].error);
+#else
+    const darm_thumb_packed_t *p = &darm_thumb_table[w];
+
+    darm_init(d);
+    if(p->stage != 0) {
+        d->w = w;
+    }
+    if(p->stage == 2) {
+        d->instr = p->instr;
+        d->instr_type = p->instr_type;
+        d->mode = M_THUMB;
+        d->size = 2;
+        d->cond = p->cond;
+        d->Rd = p->Rd, d->Rn = p->Rn, d->Rm = p->Rm, d->Rt = p->Rt;
+        d->S = p->flags & 3;
+        d->I = (p->flags >> 2) & 3;
+        d->P = (p->flags >> 4) & 3;
+        d->W = (p->flags >> 6) & 3;
+        d->reglist = p->reglist;
+        d->imm = p->imm;
+    }
+    return thumb_failure(w, p->ret, p->error);
+#endif
+}
+
+#if DARM_THUMB_TABLE == DARM_THUMB_TABLE_FULL
+
+int darm_thumb_str(const darm_t *d, darm_str_t *str)
+{
+    const uint16_t *idx;
+
+    if(d->mode != M_THUMB || d->w > 0xffff) return -1;
+
+    idx = darm_thumb_str_table[d->w];
+    if(idx[0] == 0xffff) return -1;
+
+    // the strings only apply to the instruction exactly as it was decoded
+    if(memcmp(&darm_thumb_table[d->w].d, d, sizeof(darm_t)) != 0) return -1;
+
+    strcpy(str->mnemonic, darm_thumb_strings[idx[0]]);
+    for (uint32_t i = 0; i < 4; i++) {
+        strcpy(str->arg[i], darm_thumb_strings[idx[1+i]]);
+    }
+    strcpy(str->shift, darm_thumb_strings[idx[5]]);
+    strcpy(str->instr, darm_thumb_strings[idx[6]]);
+    return 0;
+}
+
+#endif
+
+#else
+
 static int thumb_disasm(darm_t *d, uint16_t w)
 {
     uint8_t h1, h2, r1, r2;
@@ -41,7 +122,7 @@ static int thumb_disasm(darm_t *d, uint16_t w)
     lkup = &(THUMB_INSTR_LOOKUP(w));
     //lkup = &(thumb_instr_lookup[w >> 6]);
     if (I_INVLD == lkup->instr) {
-        fprintf(stderr, "thumb_disasm: null lookup: %lld\n", THUMB_LOOKUP_INDEX(w));
+        DARM_ERROR(E_LOOKUP, "thumb_disasm: null lookup: %lld\n", THUMB_LOOKUP_INDEX(w));
         return -1;
     }
 
@@ -128,7 +209,7 @@ static int thumb_disasm(darm_t *d, uint16_t w)
             d->instr = h1? I_BLX : I_BX;
             break;
         default:
-            fprintf(stderr, "thumb_disasm: T_THUMB_HIREG_BX: unhandled instruction\n");
+            DARM_ERROR(E_UNHANDLED, "thumb_disasm: T_THUMB_HIREG_BX: unhandled instruction\n");
             return -1;
         }
         return 0;
@@ -161,7 +242,7 @@ static int thumb_disasm(darm_t *d, uint16_t w)
         } else if (I_LDR == d->instr || I_STR == d->instr){
             d->imm = (GETBT(w, 6, 5) << 2);
         } else {
-            fprintf(stderr, "thumb_disasm: T_THUMB_LDST_IMM: unhandled instruction\n");
+            DARM_ERROR(E_UNHANDLED, "thumb_disasm: T_THUMB_LDST_IMM: unhandled instruction\n");
             return -1;
         }
         return 0;        
@@ -197,7 +278,7 @@ static int thumb_disasm(darm_t *d, uint16_t w)
             if (I_PUSH == d->instr) d->reglist |= (1 << LR);
             else if (I_POP == d->instr) d->reglist |= (1 << PC);
             else {
-                fprintf(stderr, "thumb_disasm: T_THUMB_PSHPOP: unhandled instruction\n");
+                DARM_ERROR(E_UNHANDLED, "thumb_disasm: T_THUMB_PSHPOP: unhandled instruction\n");
                 return -1;
             }
         }
@@ -219,7 +300,7 @@ static int thumb_disasm(darm_t *d, uint16_t w)
             d->imm = sign_ext32(d->imm, 8);
         }
         if (d->cond == 0b1110) {
-            fprintf(stderr, "thumb_disasm: T_THUMB_BR_COND,SWINT: unhandled condition\n");
+            DARM_ERROR(E_OPERAND, "thumb_disasm: T_THUMB_BR_COND,SWINT: unhandled condition\n");
             return -1;
         }
         return 0;
@@ -230,26 +311,17 @@ static int thumb_disasm(darm_t *d, uint16_t w)
         return 0;
 
     }
-    fprintf(stderr, "thumb_disasm: unhandled instruction type: %d\n", d->instr_type);
+    DARM_ERROR(E_UNHANDLED, "thumb_disasm: unhandled instruction type: %d\n", d->instr_type);
     return -1;
 }
 
-int darm_thumb_disasm(darm_t *d, uint16_t w)
+int darm_thumb_decode(darm_t *d, uint16_t w)
 {
-    memset(d, 0, sizeof(darm_t));
-    d->instr = I_INVLD;
-    d->instr_type = T_INVLD;
-    d->shift_type = S_INVLD;
-    d->S = d->E = d->U = d->H = d->P = d->I = B_INVLD;
-    d->R = d->T = d->W = d->M = d->N = d->B = B_INVLD;
-    d->dtype = d->stype = D_INVLD;
-    d->Rd = d->Rn = d->Rm = d->Ra = d->Rt = R_INVLD;
-    d->Rt2 = d->RdHi = d->RdLo = d->Rs = R_INVLD;
-    d->option = O_INVLD;
+    darm_init(d);
 
     switch (w >> 11) {
     case 0b11101: case 0b11110: case 0b11111:
-        fprintf(stderr, "darm_thumb_disasm: unknown err\n");
+        DARM_ERROR(E_UNHANDLED, "darm_thumb_disasm: unknown err\n");
         return -1;
 
     default:
@@ -257,3 +329,17 @@ int darm_thumb_disasm(darm_t *d, uint16_t w)
         return thumb_disasm(d, w);
     }
 }
+
+#endif
+
+int darm_thumb_disasm(darm_t *d, uint16_t w)
+{
+#ifdef DARM_STATS
+    uint64_t start = darm_stats_clock();
+    int ret = darm_thumb_decode(d, w);
+    darm_stats_record(d, ret, darm_stats_clock() - start);
+    return ret;
+#else
+    return darm_thumb_decode(d, w);
+#endif
+}
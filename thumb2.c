@@ -48,7 +48,7 @@ int darm_thumb2_disasm32(darm_t *d, uint32_t w)
 
     lkup = &(THUMB2_INSTR_LOOKUP(w));
     if (I_INVLD == lkup->instr) {
-        fprintf(stderr, "darm_thumb2_disasm32: null lookup: %u for 0x%lx\n", THUMB2_LOOKUP_INDEX(w), w);
+        DARM_ERROR(E_LOOKUP, "darm_thumb2_disasm32: null lookup: %u for 0x%lx\n", THUMB2_LOOKUP_INDEX(w), w);
         return -1;
     }
 
@@ -108,7 +108,7 @@ int darm_thumb2_disasm32(darm_t *d, uint32_t w)
         }
 
         else {
-            fprintf(stderr, "darm_thumb2_disasm32: unhandled branch\n");
+            DARM_ERROR(E_UNHANDLED, "darm_thumb2_disasm32: unhandled branch\n");
             return -1;
         }
 
@@ -148,16 +148,16 @@ int darm_thumb2_disasm32(darm_t *d, uint32_t w)
             d->instr = I_LDR;
             return 0;
         } else {
-            fprintf(stderr, "unhandled instruction in thumb2_other: 0x %lx\n", w);
+            DARM_ERROR(E_UNHANDLED, "unhandled instruction in thumb2_other: 0x %lx\n", w);
             return -1;
         }
 
     default:
-        fprintf(stderr, "darm_thumb2_disasm32: unhandled type: %s\n", darm_enctypes[d->instr_type]);
+        DARM_ERROR(E_UNHANDLED, "darm_thumb2_disasm32: unhandled type: %s\n", darm_enctype_name(d->instr_type));
         return -1;
 
     }
-    fprintf(stderr, "darm_thumb2_disasm32: unreachable\n");
+    DARM_ERROR(E_UNHANDLED, "darm_thumb2_disasm32: unreachable\n");
     return -1;
 
 }
@@ -168,7 +168,7 @@ int darm_thumb2_disasm16(darm_t *d, uint16_t w)
 
     lkup = &(THUMB2_16_INSTR_LOOKUP(w));
     if (I_INVLD == lkup->instr) {
-        fprintf(stderr, "darm_thumb2_disasm16: null lookup: %u\n", THUMB2_16_LOOKUP_INDEX(w));
+        DARM_ERROR(E_LOOKUP, "darm_thumb2_disasm16: null lookup: %u\n", THUMB2_16_LOOKUP_INDEX(w));
         return -1;
     }
 
@@ -233,26 +233,27 @@ int darm_thumb2_disasm16(darm_t *d, uint16_t w)
             d->instr = I_SEV;
             break;
         default:
-            fprintf(stderr, "bits 8-12 are 0x%x\n", GETBT(w, 8, 4));
+            // other hints are left as I_IT, which is rejected below
+            break;
         }
 
         if (GETBT(w, 0, 4)){
             if (I_IT != d->instr){
-                fprintf(stderr, "failure 1\n");
+                DARM_ERROR(E_UNHANDLED, "failure 1\n");
                 return -1;
             }
         }
 
         // I_IT instructions should never appear in assembled code
-        if (I_IT == d->instr) { fprintf(stderr, "failure 2\n");return -1;}
+        if (I_IT == d->instr) { DARM_ERROR(E_UNHANDLED, "failure 2\n");return -1;}
         return 0;
 
     default:
-        fprintf(stderr, "failure 3\n");
+        DARM_ERROR(E_UNHANDLED, "failure 3\n");
         return -1;
     }
 
-    fprintf(stderr, "failure 4\n");
+    DARM_ERROR(E_UNHANDLED, "failure 4\n");
     return -1;
 }
 
@@ -323,7 +324,7 @@ static int load_fields(darm_t *d, uint32_t w, darm_fieldloader_t* f)
         } else if(d->dtype == D_32) {
             d->ext_registers = extract_imm(&(f->imm), w);
         } else {
-            fprintf(stderr, "thumb2_disas_neon: datatype error for VLDM/VSTM: %d\n", d->dtype);
+            DARM_ERROR(E_OPERAND, "thumb2_disas_neon: datatype error for VLDM/VSTM: %d\n", d->dtype);
             return -1;
         }
         
@@ -358,27 +359,16 @@ static darm_fieldloader_t* get_fieldloader(darm_t *d, uint32_t w)
     return f;
 }
 
-int darm_thumb2_disasm(darm_t *d, uint16_t w, uint16_t w2)
+static int thumb2_disasm(darm_t *d, uint16_t w, uint16_t w2)
 {
     (void)d; (void) w; (void) w2;
     uint32_t tmp = 0;
     int ret;
     
-    memset(d, 0, sizeof(darm_t));
-    d->instr = I_INVLD;
-    d->instr_type = T_INVLD;
-    d->shift_type = S_INVLD;
-    d->S = d->E = d->U = d->H = d->P = d->I = B_INVLD;
-    d->R = d->T = d->W = d->M = d->N = d->B = B_INVLD;
-    d->dtype = d->stype = D_INVLD;
-    d->Rd = d->Rn = d->Rm = d->Ra = d->Rt = R_INVLD;
-    d->Rt2 = d->RdHi = d->RdLo = d->Rs = R_INVLD;
-    d->option = O_INVLD;
-
-    // try 16bit first
+    // try 16bit first, darm_thumb_decode() initializes d itself
     if (!IS_THUMB2_32BIT(w)){
         // first try thumb1
-        ret = darm_thumb_disasm(d, w);
+        ret = darm_thumb_decode(d, w);
 
         // if thumb1 fails, try 16-bit thumb2
         if (ret){
@@ -389,12 +379,13 @@ int darm_thumb2_disasm(darm_t *d, uint16_t w, uint16_t w2)
     }
 
     // try 32-bit
+    darm_init(d);
     tmp = (((uint32_t)w) << 16) | ((uint32_t)w2);
     d->w = tmp;
     darm_fieldloader_t* f = get_fieldloader(d, tmp);
     if(f != NULL) {
         if(f->instr == I_INVLD) {
-            fprintf(stderr, "thumb2.c: null lookup for 0x%lx\n", w);
+            DARM_ERROR(E_LOOKUP, "thumb2.c: null lookup for 0x%lx\n", w);
             return -1;
         }
         return load_fields(d, tmp, f);
@@ -402,6 +393,18 @@ int darm_thumb2_disasm(darm_t *d, uint16_t w, uint16_t w2)
         return darm_thumb2_disasm32(d, tmp);
     }
 
-    fprintf(stderr, "darm_thumb2_disasm: unreachable\n");
+    DARM_ERROR(E_UNHANDLED, "darm_thumb2_disasm: unreachable\n");
     return -1;
 }
+
+int darm_thumb2_disasm(darm_t *d, uint16_t w, uint16_t w2)
+{
+#ifdef DARM_STATS
+    uint64_t start = darm_stats_clock();
+    int ret = thumb2_disasm(d, w, w2);
+    darm_stats_record(d, ret, darm_stats_clock() - start);
+    return ret;
+#else
+    return thumb2_disasm(d, w, w2);
+#endif
+}